@@ -0,0 +1,273 @@
+"""
+==========================
+Parser and I/O benchmarks
+==========================
+
+Measures the throughput and peak memory of the output parsers
+(eldo_iofile.read of event, time and sample outputs, extract_powers),
+the input writer (eldo_iofile.write) and the testbench generation
+(testbench.generate_contents) on synthetic Eldo-format files.
+
+Each case is timed as the best of the given number of repeats. The peak
+memory is measured with tracemalloc on a separate run. The results can be
+saved as a baseline, and later runs are compared to it: a case slower (or
+using more memory) than the baseline by more than the tolerance fails the
+comparison, and the script exits with status 1. Usage:
+
+    python io_parsing.py --save
+    python io_parsing.py --scale 4 --cases read_event_numpy,extract_powers
+
+Baselines are machine specific, and compared only for equal sizes. Without
+a baseline file the script exits with status 2, so that a CI job without
+one does not pass silently. On a CI machine, save the baseline once from
+a known good revision, keep it with the machine (or pass its location
+with --baseline), and run the comparison on each change:
+
+    python io_parsing.py --save --baseline /ci/cache/io_parsing_baseline.json
+    python io_parsing.py --baseline /ci/cache/io_parsing_baseline.json
+
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import numpy as np
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0,os.path.dirname(os.path.realpath(__file__)))
+from thesdk import *
+from eldo import *
+from eldo.testbench import testbench as etb
+from eldo.eldo_iofile import eldo_iofile
+from eldo.eldo_simcmd import eldo_simcmd
+from eldo.eldo_dcsource import eldo_dcsource
+from eldo.eldo_chilog import eldo_chilog
+import synthetic
+
+def make_entity(rootdir,name='bench_dut'):
+    classfile = os.path.join(rootdir,name,name+'.py')
+    class bench_dut(eldo):
+        @property
+        def _classfile(self):
+            return classfile
+        def __init__(self):
+            self.IOS = Bundle()
+            eldo_simcmd(self,sim='tran',tstop='10n')
+    return bench_dut()
+
+# Each case returns a dict of the timed function 'run', the number of
+# bytes and items processed, and the item unit.
+
+def case_read_event(rootdir,scale,reader):
+    entity = make_entity(rootdir)
+    iofile = eldo_iofile(entity,name='z',ionames=['Z'],dir='out',iotype='event',reader=reader)
+    rows = int(200000*scale)
+    synthetic.write_printfile(iofile.file[0],rows)
+    def run():
+        iofile.Data = None
+        iofile.read()
+    return { 'run' : run, 'bytes' : os.path.getsize(iofile.file[0]), 'items' : rows, 'unit' : 'rows' }
+
+def case_read_event_runs(rootdir,scale):
+    entity = make_entity(rootdir)
+    entity.eldoruns = [ { 'eldoparameters' : { 'vdd' : v } } for v in [0.8,0.9,1.0,1.1] ]
+    iofile = eldo_iofile(entity,name='z',ionames=['Z'],dir='out',iotype='event')
+    rows = int(50000*scale)
+    synthetic.write_printfile(iofile.file[0],rows,runs=4)
+    def run():
+        iofile.Data = None
+        iofile.read()
+    return { 'run' : run, 'bytes' : os.path.getsize(iofile.file[0]), 'items' : 4*rows, 'unit' : 'rows' }
+
+def case_read_time(rootdir,scale):
+    entity = make_entity(rootdir)
+    iofile = eldo_iofile(entity,name='z',ionames=['Z'],dir='out',iotype='time',edgetype='both')
+    crossings = int(100000*scale)
+    synthetic.write_crossings(iofile.file[0],'Z',crossings,edge='tcross')
+    def run():
+        iofile.Data = None
+        iofile.read()
+    return { 'run' : run, 'bytes' : os.path.getsize(iofile.file[0]), 'items' : crossings, 'unit' : 'crossings' }
+
+def case_read_sample(rootdir,scale,sampleformat):
+    entity = make_entity(rootdir)
+    iofile = eldo_iofile(entity,name='d',ionames=['DOUT'],dir='out',iotype='sample',
+            trigger='CLK',sampleformat=sampleformat)
+    bits, samples = 16, int(10000*scale)
+    synthetic.write_bus(iofile.file[0],'DOUT',bits,samples)
+    def run():
+        iofile.Data = None
+        iofile.read()
+    return { 'run' : run, 'bytes' : os.path.getsize(iofile.file[0]), 'items' : samples, 'unit' : 'samples' }
+
+def case_read_sample_runs(rootdir,scale):
+    entity = make_entity(rootdir)
+    entity.eldoruns = [ { 'eldoparameters' : { 'vdd' : v } } for v in [0.8,0.9,1.0,1.1] ]
+    iofile = eldo_iofile(entity,name='d',ionames=['DOUT'],dir='out',iotype='sample',
+            trigger='CLK',sampleformat='uint')
+    bits, samples = 16, int(2500*scale)
+    synthetic.write_bus(iofile.file[0],'DOUT',bits,samples,runs=4)
+    def run():
+        iofile.Data = None
+        iofile.read()
+        if len(iofile.Data) != 4 or any([ len(run) != samples for run in iofile.Data ]):
+            raise ValueError('Runs of %s split incorrectly.' % iofile.file[0])
+    return { 'run' : run, 'bytes' : os.path.getsize(iofile.file[0]), 'items' : 4*samples, 'unit' : 'samples' }
+
+def case_write_event(rootdir,scale,**kwargs):
+    entity = make_entity(rootdir)
+    iofile = eldo_iofile(entity,name='a',ionames=['A0','A1'],dir='in',iotype='event',**kwargs)
+    rows = int(100000*scale)
+    rng = np.random.default_rng(0)
+    data = np.empty((rows,4))
+    data[:,0] = data[:,2] = np.arange(rows)*1e-12
+    data[:,1] = rng.random(rows)
+    data[:,3] = np.round(rng.random(rows))
+    iofile.Data = data
+    def run():
+        iofile.write()
+    nbytes = lambda: sum([ os.path.getsize(f) for f in iofile.file ])
+    return { 'run' : run, 'bytes' : nbytes, 'items' : 2*rows, 'unit' : 'points' }
+
+def case_extract_powers(rootdir,scale):
+    entity = make_entity(rootdir)
+    sources = max(int(20*scale),1)
+    for k in range(sources):
+        eldo_dcsource(entity,name='vdd%d' % k,value=1.0,pos='VDD%d' % k,neg='0',extract=True)
+    entity.tb = etb(entity)
+    entity.tb.iofiles = entity.iofile_bundle
+    entity.tb.dcsources = entity.dcsource_bundle
+    entity.tb.simcmds = entity.simcmd_bundle
+    entity.tb.generate_contents()
+    synthetic.write_chi(entity.eldochisrc,sources,progresslines=int(200000*scale))
+    def run():
+        # A new parser, so that the file is parsed on each repeat
+        entity.eldo_chilog = eldo_chilog(entity)
+        entity.extract_powers()
+    return { 'run' : run, 'bytes' : os.path.getsize(entity.eldochisrc), 'items' : 2*sources, 'unit' : 'extracts' }
+
+def case_generate_contents(rootdir,scale):
+    entity = make_entity(rootdir)
+    os.makedirs(os.path.join(rootdir,'eldo'),exist_ok=True)
+    subckts = int(5000*scale)
+    synthetic.write_dut(os.path.join(rootdir,'eldo','bench_dut.cir'),'bench_dut',subckts)
+    nodes = max(int(50*scale),1)
+    rng = np.random.default_rng(0)
+    for k in range(nodes):
+        eldo_iofile(entity,name='in%d' % k,ionames=['IN%d' % k],dir='in',iotype='event',
+                Data=np.column_stack((np.arange(100)*1e-10,rng.random(100))))
+        eldo_iofile(entity,name='out%d' % k,ionames=['OUT%d' % k],dir='out',iotype='event')
+    eldo_dcsource(entity,name='dd',value=1.0,pos='VDD',neg='VSS',extract=True)
+    def run():
+        entity.tb = etb(entity)
+        entity.tb.iofiles = entity.iofile_bundle
+        entity.tb.dcsources = entity.dcsource_bundle
+        entity.tb.simcmds = entity.simcmd_bundle
+        entity.tb.generate_contents()
+    return { 'run' : run, 'bytes' : os.path.getsize(os.path.join(rootdir,'eldo','bench_dut.cir')),
+            'items' : subckts, 'unit' : 'subckts' }
+
+cases = {
+        'read_event_genfromtxt' : lambda d,s: case_read_event(d,s,'genfromtxt'),
+        'read_event_pandas' : lambda d,s: case_read_event(d,s,'pandas'),
+        'read_event_numpy' : lambda d,s: case_read_event(d,s,'numpy'),
+        'read_event_runs' : case_read_event_runs,
+        'read_time' : case_read_time,
+        'read_sample_bin' : lambda d,s: case_read_sample(d,s,'bin'),
+        'read_sample_uint' : lambda d,s: case_read_sample(d,s,'uint'),
+        'read_sample_runs' : case_read_sample_runs,
+        'write_event' : case_write_event,
+        'write_event_compressed' : lambda d,s: case_write_event(d,s,pwlatol=1e-3,writeprecision=6),
+        'extract_powers' : case_extract_powers,
+        'generate_contents' : case_generate_contents,
+        }
+
+def measure(case,repeats):
+    """Best wall-clock time of the repeats and the peak traced memory."""
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for k in range(repeats):
+            start = time.perf_counter()
+            case['run']()
+            times.append(time.perf_counter()-start)
+        tracemalloc.start()
+        try:
+            case['run']()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    nbytes = case['bytes']() if callable(case['bytes']) else case['bytes']
+    return { 'time' : min(times), 'peak' : peak, 'bytes' : nbytes,
+            'items' : case['items'], 'unit' : case['unit'] }
+
+def compare(results,baseline,tolerance):
+    """Names of the cases slower or using more memory than the baseline."""
+    failed = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or base['items'] != result['items']:
+            print('%-24s no baseline of this size' % name)
+            continue
+        timeratio = result['time']/base['time']
+        peakratio = result['peak']/max(base['peak'],1)
+        # Memory differences below 1 MB are noise
+        slower = timeratio > 1+tolerance
+        larger = peakratio > 1+tolerance and result['peak']-base['peak'] > 1<<20
+        print('%-24s time x%.2f  peak x%.2f%s' % (name,timeratio,peakratio,
+            '  FAILED' if slower or larger else ''))
+        if slower or larger:
+            failed.append(name)
+    return failed
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Throughput and peak memory of the parsers and writers.')
+    parser.add_argument('--scale',type=float,default=1.0,help='Size factor of the synthetic files.')
+    parser.add_argument('--repeats',type=int,default=5)
+    parser.add_argument('--cases',type=str,default=','.join(cases.keys()),
+            help='Comma separated cases, default all: %s.' % ', '.join(cases.keys()))
+    parser.add_argument('--baseline',type=str,
+            default=os.path.join(os.path.dirname(os.path.realpath(__file__)),'io_parsing_baseline.json'))
+    parser.add_argument('--save',action='store_true',help='Save the results as the baseline.')
+    parser.add_argument('--tolerance',type=float,default=0.25,
+            help='Allowed relative slowdown and memory increase. Default 0.25.')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.cases.split(','):
+        if name not in cases:
+            parser.error('Unknown case %s.' % name)
+        rootdir = tempfile.mkdtemp()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                case = cases[name](rootdir,args.scale)
+            results[name] = measure(case,args.repeats)
+        finally:
+            shutil.rmtree(rootdir,ignore_errors=True)
+        r = results[name]
+        print('%-24s %9.3f ms  %8.1f MB/s  %10.3g %s/s  peak %8.1f MB' % (name,r['time']*1e3,
+            r['bytes']/r['time']/1e6,r['items']/r['time'],r['unit'],r['peak']/1e6))
+
+    if args.save:
+        baseline = {}
+        if os.path.isfile(args.baseline):
+            with open(args.baseline) as infile:
+                baseline = json.load(infile)
+        baseline.update(results)
+        with open(args.baseline,'w') as outfile:
+            json.dump(baseline,outfile,indent=2,sort_keys=True)
+        print('Saved baseline to %s.' % args.baseline)
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline) as infile:
+            failed = compare(results,json.load(infile),args.tolerance)
+        if failed:
+            print('Slower than baseline: %s.' % ', '.join(failed))
+            sys.exit(1)
+    else:
+        print('No baseline %s, nothing compared. Save one with --save.' % args.baseline)
+        sys.exit(2)
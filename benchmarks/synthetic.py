@@ -0,0 +1,80 @@
+"""
+=========================
+Synthetic Eldo output
+=========================
+
+Generators of synthetic Eldo-format files for the benchmarks: printfiles,
+vector extract files of yval (sampled buses) and xup/xdown/tcross
+(threshold crossings), .chi logs with CURRENT_/POWER_ extracts, and DUT
+netlists. The values are random, the formats are those parsed by
+eldo_iofile and eldo_chilog.
+
+"""
+import numpy as np
+
+def write_printfile(fname,rows,nodes=1,runs=1,seed=0):
+    """Printfile of the given number of time-value rows and nodes (one
+    time and one value column per node) for each run. Each run starts with
+    two header lines."""
+    rng = np.random.default_rng(seed)
+    time = np.arange(rows)*1e-12
+    fmt = ' '.join(['%.6e']*(2*nodes))
+    with open(fname,'w') as outfile:
+        for run in range(runs):
+            outfile.write('#Eldo printfile\n#TIME %s\n' % ' '.join([ 'V(N%d)' % k for k in range(nodes) ]))
+            data = np.empty((rows,2*nodes))
+            data[:,0::2] = time[:,None]
+            data[:,1::2] = rng.random((rows,nodes))
+            np.savetxt(outfile,data,fmt=fmt)
+
+def write_crossings(fname,ioname,crossings,edge='xup',seed=0):
+    """Vector extract file of the threshold crossing times of a node, as
+    written by '.extract vect label=<ioname> xup(...)'."""
+    rng = np.random.default_rng(seed)
+    times = np.cumsum(rng.random(crossings)*1e-9)
+    with open(fname,'w') as outfile:
+        outfile.write('* .EXTRACT VECT %s\n' % edge.upper())
+        outfile.writelines([ '.%s %s[%d] = %.6e\n' % (edge.upper(),ioname.upper(),k+1,t)
+            for k, t in enumerate(times) ])
+
+def write_bus(fname,ioname,bits,samples,runs=1,seed=0):
+    """Vector extract file of a sampled bus, as written by
+    '.extract vect label=<ioname> yval(v(<ioname><*>),xup(...))', for each
+    run. The samples are listed bit by bit."""
+    rng = np.random.default_rng(seed)
+    with open(fname,'w') as outfile:
+        for run in range(runs):
+            values = rng.random((bits,samples))
+            outfile.write('* .EXTRACT VECT YVAL %s\n' % ioname.upper())
+            for bit in range(bits):
+                outfile.writelines([ '.YVAL %s<%d>[%d] = %.4e\n' % (ioname.upper(),bit,k+1,v)
+                    for k, v in enumerate(values[bit]) ])
+
+def write_chi(fname,sources,progresslines=0,runs=1,seed=0):
+    """.chi log with the CURRENT_ and POWER_ extracts of the given number of
+    DC sources for each run, preceded by the given number of progress lines."""
+    rng = np.random.default_rng(seed)
+    with open(fname,'w') as outfile:
+        outfile.write('Eldo synthetic log\n')
+        outfile.writelines([ ' Transient time = %.4en  Step = 1.0000e-12 CPU time = %d\n' % (k*1e-3,k)
+            for k in range(progresslines) ])
+        for run in range(runs):
+            if runs > 1:
+                outfile.write(' ***** .STEP PARAM VDD = %g\n' % (0.8+0.1*run))
+            for label in ['CURRENT','POWER']:
+                outfile.writelines([ '* %s_VDD%d = %.6e\n' % (label,k,v)
+                    for k, v in enumerate(rng.random(sources)*1e-3) ])
+
+def write_dut(fname,cellname,subckts,devices=2):
+    """DUT netlist of the given number of leaf subcircuits, instantiated by
+    the top cell in a chain."""
+    with open(fname,'w') as outfile:
+        outfile.write('*** Design cell name: %s\n' % cellname)
+        for k in range(subckts):
+            outfile.write('.SUBCKT CELL%d A Z VDD VSS\n' % k)
+            outfile.writelines([ 'M%d Z A %s %s %s w=1u l=30n\n' % ((d,)+(('VDD','VDD','pch') if d%2 else ('VSS','VSS','nch')))
+                for d in range(devices) ])
+            outfile.write('.ENDS\n')
+        outfile.write('.SUBCKT %s A Z VDD VSS\n' % cellname.upper())
+        outfile.writelines([ 'XC%d N%d N%d VDD VSS CELL%d\n' % (k,k,k+1,k) for k in range(subckts) ])
+        outfile.write('.ENDS\n')
@@ -0,0 +1,76 @@
+"""
+===============================
+Testbench generation benchmark
+===============================
+
+Measures the per-point overhead of preparing an eldo simulation
+(testbench generation and export) in a parameter sweep, with and without
+reuse_testbench.
+
+The DUT is a synthetic netlist of the given number of subcircuits, written
+to a temporary entity directory. Usage:
+
+    python testbench_generation.py --points 200 --subckts 20000
+
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from thesdk import *
+from eldo import *
+from eldo.eldo_simcmd import eldo_simcmd
+from eldo.eldo_dcsource import eldo_dcsource
+
+def write_dut(fname,nsubckts):
+    with open(fname,'w') as outfile:
+        outfile.write('*** Design cell name: bench_top\n')
+        for k in range(nsubckts):
+            outfile.write('.SUBCKT CELL%d A Z VDD VSS\n' % k)
+            outfile.write('M1 Z A VDD VDD pch w=1u l=30n\nM2 Z A VSS VSS nch w=1u l=30n\n.ENDS\n')
+        outfile.write('.SUBCKT BENCH_TOP A Z VDD VSS\n')
+        outfile.write('XC0 A Z VDD VSS CELL0\n.ENDS\n')
+
+def make_entity(rootdir):
+    classfile = os.path.join(rootdir,'bench_dut','bench_dut.py')
+    class bench_dut(eldo):
+        @property
+        def _classfile(self):
+            return classfile
+        def __init__(self):
+            self.IOS = Bundle()
+            eldo_simcmd(self,sim='tran',tstop='10n')
+            eldo_dcsource(self,name='dd',value=1.0,pos='VDD',neg='VSS',extract=True)
+    return bench_dut()
+
+def run(points,entity):
+    times = []
+    for k in range(points):
+        entity.eldoparameters = { 'vdd' : 0.8+k*1e-3 }
+        start = time.perf_counter()
+        entity.prepare_eldo_sim()
+        times.append(time.perf_counter()-start)
+    return times
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Testbench generation overhead per sweep point.')
+    parser.add_argument('--points',type=int,default=100)
+    parser.add_argument('--subckts',type=int,default=10000)
+    args = parser.parse_args()
+    rootdir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(rootdir,'eldo'))
+        write_dut(os.path.join(rootdir,'eldo','bench_dut.cir'),args.subckts)
+        for reuse in [False,True]:
+            entity = make_entity(rootdir)
+            entity.reuse_testbench = reuse
+            times = run(args.points,entity)
+            print('reuse_testbench=%-5s first %8.2f ms, per point %8.3f ms (mean of %d)' % \
+                    (reuse,times[0]*1e3,sum(times[1:])/max(len(times)-1,1)*1e3,len(times)-1))
+    finally:
+        shutil.rmtree(rootdir,ignore_errors=True)
+
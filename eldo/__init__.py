@@ -11,12 +11,20 @@ Initially written by Okko Järvinen, 2019
 """
 import os
 import sys
+import re
 import subprocess
 import shlex
 import pdb
 import shutil
+import signal
+import threading
 import time
+import types
+import asyncio
+import concurrent.futures
 from datetime import datetime
+from copy import deepcopy
+from io import StringIO
 from abc import * 
 from thesdk import *
 import numpy as np
@@ -27,6 +35,12 @@ from eldo.testbench import testbench as etb
 from eldo.eldo_iofile import eldo_iofile as eldo_iofile
 from eldo.eldo_dcsource import eldo_dcsource as eldo_dcsource
 from eldo.eldo_simcmd import eldo_simcmd as eldo_simcmd
+from eldo.eldo_lazydata import eldo_lazydata as eldo_lazydata
+from eldo.eldo_retrypolicy import eldo_retrypolicy as eldo_retrypolicy
+from eldo.eldo_resultcache import eldo_resultcache as eldo_resultcache
+from eldo.eldo_runprofile import eldo_runprofile as eldo_runprofile
+from eldo.eldo_progressmonitor import eldo_progressmonitor as eldo_progressmonitor
+from eldo.eldo_chilog import eldo_chilog as eldo_chilog
 
 class eldo(thesdk,metaclass=abc.ABCMeta):
     """Adding this class as a superclass enforces the definitions 
@@ -113,6 +127,145 @@ class eldo(thesdk,metaclass=abc.ABCMeta):
     def nproc(self,value):
         self._nproc=value
 
+    @property
+    def read_workers(self):
+        """Number of threads parsing the output files in read_outfile. 
+        Default 1 (sequential)."""
+        if hasattr(self,'_read_workers'):
+            return self._read_workers
+        else:
+            self._read_workers=1
+        return self._read_workers
+    @read_workers.setter
+    def read_workers(self,value):
+        self._read_workers=value
+
+    @property
+    def lazy_outputs(self):
+        """True | False (default)
+
+        If True, output files are parsed only when the Data of the output
+        is first accessed. Requires preserve_iofiles=True, otherwise the
+        outputs are read right after the simulation."""
+        if hasattr(self,'_lazy_outputs'):
+            return self._lazy_outputs
+        else:
+            self._lazy_outputs=False
+        return self._lazy_outputs
+    @lazy_outputs.setter
+    def lazy_outputs(self,value):
+        self._lazy_outputs=value
+
+    @property
+    def consolidate_outputs(self):
+        """True | False (default)
+
+        If True, all event type outputs are printed to a single multi-column
+        printfile (eldoprintfile) and all time and sample type outputs are
+        extracted to a single labeled file (eldoextractfile), instead of a
+        file per node."""
+        if hasattr(self,'_consolidate_outputs'):
+            return self._consolidate_outputs
+        else:
+            self._consolidate_outputs=False
+        return self._consolidate_outputs
+    @consolidate_outputs.setter
+    def consolidate_outputs(self,value):
+        self._consolidate_outputs=value
+
+    @property
+    def eldoprintfile(self):
+        """Shared printfile of the event type outputs when consolidate_outputs is True."""
+        return self.eldosimpath + '/outputs_' + self.name + '_print.txt'
+
+    @property
+    def eldoextractfile(self):
+        """Shared extract file of the time and sample type outputs when consolidate_outputs is True."""
+        return self.eldosimpath + '/outputs_' + self.name + '_extract.txt'
+
+    @property
+    def reuse_testbench(self):
+        """True | False (default)
+
+        If True, the testbench of the previous run is reused and only the
+        sections whose inputs have changed (e.g. eldoparameters in a sweep)
+        are regenerated. The DUT netlist is parsed again only when the
+        file changes."""
+        if hasattr(self,'_reuse_testbench'):
+            return self._reuse_testbench
+        else:
+            self._reuse_testbench=False
+        return self._reuse_testbench
+    @reuse_testbench.setter
+    def reuse_testbench(self,value):
+        self._reuse_testbench=value
+
+    @property
+    def prune_subckts(self):
+        """True | False (default)
+
+        If True, only the subcircuits instantiated by the design cell
+        (directly or through other subcircuits) are exported from the DUT
+        netlist. The instances are parsed from the X lines of the netlist."""
+        if hasattr(self,'_prune_subckts'):
+            return self._prune_subckts
+        else:
+            self._prune_subckts=False
+        return self._prune_subckts
+    @prune_subckts.setter
+    def prune_subckts(self,value):
+        self._prune_subckts=value
+
+    @property
+    def eldo_dutinclude(self):
+        """'copy' (default) | 'include' | 'hardlink' | 'symlink'
+
+        How the DUT netlist is brought to the simulation. 'copy' writes the
+        subcircuits of the DUT to the subcircuit file of each run. The other
+        modes include the DUT file directly, or a hard or symbolic link to it
+        in the simulation directory, so that the export time and the disk
+        usage of a run do not depend on the size of the netlist. The design
+        cell is then wrapped to a subcircuit of the name of the entity. Note
+        that the whole DUT file is included, also the statements outside the
+        subcircuits of the design. A hard link keeps the netlist of a run if
+        the DUT file is replaced during the simulation."""
+        if hasattr(self,'_eldo_dutinclude'):
+            return self._eldo_dutinclude
+        else:
+            self._eldo_dutinclude='copy'
+        return self._eldo_dutinclude
+    @eldo_dutinclude.setter
+    def eldo_dutinclude(self,value):
+        self._eldo_dutinclude=value
+
+    @property
+    def eldo_indexdir(self):
+        """Directory of the persistent subcircuit index of the DUT file
+        (see eldo_subcktindex). Default None, the temporary directory."""
+        if hasattr(self,'_eldo_indexdir'):
+            return self._eldo_indexdir
+        else:
+            self._eldo_indexdir=None
+        return self._eldo_indexdir
+    @eldo_indexdir.setter
+    def eldo_indexdir(self,value):
+        self._eldo_indexdir=value
+
+    @property
+    def eldo_dutlink(self):
+        """Link to the DUT file created by the 'hardlink' and 'symlink' modes
+        of eldo_dutinclude, None if not linked. Removed with the subcircuit
+        file that includes it, and like it kept with interactive_eldo and
+        preserve_eldofiles. A kept link is replaced by the next run."""
+        if hasattr(self,'_eldo_dutlink'):
+            return self._eldo_dutlink
+        else:
+            self._eldo_dutlink=None
+        return self._eldo_dutlink
+    @eldo_dutlink.setter
+    def eldo_dutlink(self,value):
+        self._eldo_dutlink=value
+
     @property
     def iofile_bundle(self):
         """ 
@@ -136,6 +289,14 @@ class eldo(thesdk,metaclass=abc.ABCMeta):
                     self.print_log(type="I", msg="Preserving file %s." %(f))
             else:
                 val.remove()
+        if self.consolidate_outputs and not self.preserve_iofiles:
+            for f in [self.eldoprintfile, self.eldoextractfile]:
+                try:
+                    if os.path.exists(f):
+                        os.remove(f)
+                        self.print_log(type='I',msg='Removing %s.' % f)
+                except:
+                    self.print_log(type='W',msg='Could not remove %s.' % f)
         if (not self.preserve_iofiles) and self.interactive_eldo:
             simpathname = self.eldosimpath
             try:
@@ -190,6 +351,49 @@ class eldo(thesdk,metaclass=abc.ABCMeta):
 
         return self._eldo_submission
 
+    @property
+    def eldo_timeout(self):
+        """Wall-clock limit of a simulation attempt in seconds. Default None (unlimited).
+
+        Local simulations are killed on expiry. LSF submissions get the
+        limit as 'bsub -W' (run time in minutes). An expired run is
+        classified as 'timeout'."""
+        if not hasattr(self,'_eldo_timeout'):
+            self._eldo_timeout=None
+        return self._eldo_timeout
+    @eldo_timeout.setter
+    def eldo_timeout(self,value):
+        self._eldo_timeout=value
+
+    @property
+    def eldo_memlimit(self):
+        """Memory limit of a simulation in bytes. Default None (unlimited).
+
+        Local simulations run with the address space limited by 'ulimit -v'.
+        LSF submissions get the limit as 'bsub -M' (in MB). A run exceeding
+        the limit is classified as 'memory'."""
+        if not hasattr(self,'_eldo_memlimit'):
+            self._eldo_memlimit=None
+        return self._eldo_memlimit
+    @eldo_memlimit.setter
+    def eldo_memlimit(self,value):
+        self._eldo_memlimit=value
+
+    # LSF options of the resource limits
+    @property
+    def eldo_submissionlimits(self):
+        limits = ''
+        if self.eldo_timeout is not None:
+            limits += '-W %d ' % max(1,-(-self.eldo_timeout//60))
+        if self.eldo_memlimit is not None:
+            limits += '-M %dMB ' % max(1,-(-self.eldo_memlimit//2**20))
+        return limits
+
+    # The simulator runs in localhost
+    @property
+    def _eldo_islocal(self):
+        return self.interactive_eldo or self.eldo_submission.strip() == ''
+
     @property
     def eldoparameters(self): 
         if not hasattr(self, '_eldoparameters'):
@@ -226,6 +430,47 @@ class eldo(thesdk,metaclass=abc.ABCMeta):
     def eldooptions(self): 
             self._eldooptions = None
 
+    @property
+    def eldoruns(self):
+        """List of dicts (default empty)
+
+        Points of a batched simulation. Each point may define 'eldoparameters',
+        'eldocorner' and 'eldooptions' dicts, which update the corresponding
+        properties for that run. All points are simulated in a single Eldo
+        invocation (see eldorunmode), and the outputs get a leading run axis:
+        Data of an output is of shape (runs,rows,columns), padded with NaN, or
+        a list of per-run arrays if the iofile is ragged. Powers and currents
+        are arrays of one value per run.
+
+        Example
+        -------
+            self.eldoruns = [ {'eldocorner':{'corner':c}} for c in ['top_ff','top_tt','top_ss'] ]
+        """
+        if not hasattr(self, '_eldoruns'):
+            self._eldoruns = []
+        return self._eldoruns
+    @eldoruns.setter
+    def eldoruns(self,value):
+            self._eldoruns = value
+    @eldoruns.deleter
+    def eldoruns(self):
+            self._eldoruns = []
+
+    @property
+    def eldorunmode(self):
+        """'auto' (default) | 'step' | 'alter'
+
+        Netlist construct of the batched runs in eldoruns. 'step' emits a
+        single '.step param' statement and requires the runs to vary only
+        one parameter. 'alter' emits an '.alter' block per run after the
+        first. 'auto' selects 'step' whenever possible."""
+        if not hasattr(self, '_eldorunmode'):
+            self._eldorunmode = 'auto'
+        return self._eldorunmode
+    @eldorunmode.setter
+    def eldorunmode(self,value):
+            self._eldorunmode = value
+
     @property
     def eldoiofiles(self): 
         if not hasattr(self, '_eldoiofiles'):
@@ -353,9 +598,11 @@ class eldo(thesdk,metaclass=abc.ABCMeta):
                 self.eldotbsrc,
                 self.eldosubcktsrc
                 ]
+            if self.eldo_dutlink is not None:
+                filelist.append(self.eldo_dutlink)
             for f in filelist:
                 try:
-                    if os.path.exists(f):
+                    if os.path.lexists(f):
                         os.remove(f)
                         self.print_log(type='I',msg='Removing %s.' % f)
                 except:
@@ -390,22 +637,16 @@ class eldo(thesdk,metaclass=abc.ABCMeta):
     @property
     def eldocmd(self):
         if self.interactive_eldo:
-            ezwave = "-ezwave"
             submission=""
         else:
-            ezwave = ""
             submission=self.eldo_submission
-
-        if self.nproc:
-            nproc = "-use_proc %d" % self.nproc
+        if submission.strip() != '':
+            # Limits only for a scheduler prefix, local runs are limited here
+            submission += self.eldo_submissionlimits
         else:
-            nproc = ""
-
-        eldosimcmd = "eldo -64b -queue %s %s " % (ezwave,nproc)
-        eldotbfile = self.eldotbsrc
+            submission = ''
         self._eldocmd = submission +\
-                        eldosimcmd +\
-                        eldotbfile
+                        self.eldolocalcmd
         return self._eldocmd
 
     # Just to give the freedom to set this if needed
@@ -416,20 +657,39 @@ class eldo(thesdk,metaclass=abc.ABCMeta):
     def eldocmd(self):
         self._eldocmd=None
 
+    # Simulator command without the submission prefix
+    @property
+    def eldolocalcmd(self):
+        if self.interactive_eldo:
+            ezwave = "-ezwave"
+        else:
+            ezwave = ""
+
+        if self.nproc:
+            nproc = "-use_proc %d" % self.nproc
+        else:
+            nproc = ""
+
+        eldosimcmd = "eldo -64b -queue %s %s " % (ezwave,nproc)
+        eldotbfile = self.eldotbsrc
+        return eldosimcmd + eldotbfile
+
     def connect_inputs(self):
         for ioname,io in self.IOS.Members.items():
             if ioname in self.iofile_bundle.Members:
                 val=self.iofile_bundle.Members[ioname]
                 # File type inputs are driven by the file.Data, not the input field
                 if not isinstance(self.IOS.Members[val.name].Data,eldo_iofile) \
-                        and val.dir is 'in':
+                        and val.dir == 'in':
                     # Data must be properly shaped
                     self.iofile_bundle.Members[ioname].Data=self.IOS.Members[ioname].Data
 
     def connect_outputs(self):
         for name,val in self.iofile_bundle.Members.items():
-            if val.dir is 'out':
+            if val.dir == 'out':
                 self.IOS.Members[name].Data=self.iofile_bundle.Members[name].Data
+                if isinstance(val.Data,eldo_lazydata):
+                    val.Data.bind(self.IOS.Members[name])
 
     # This writes infiles
     def write_infile(self):
@@ -437,79 +697,880 @@ class eldo(thesdk,metaclass=abc.ABCMeta):
             if val.dir.lower()=='in' or val.dir.lower()=='input':
                 self.iofile_bundle.Members[name].write()
 
+    # Columns of the event type outputs in the shared printfile.
+    # Column 0 is the time.
+    def consolidated_columns(self):
+        columns = {}
+        col = 1
+        for name, val in self.iofile_bundle.Members.items():
+            if (val.dir.lower()=='out' or val.dir.lower()=='output') and val.iotype=='event':
+                columns[name] = list(range(col,col+len(val.ionames)))
+                col += len(val.ionames)
+        return columns
+
+    # Reading the given outputs from the shared output files, parsing
+    # each file once
+    def read_consolidated(self,outputs):
+        parts = dict([ (val.name,[]) for val in outputs ])
+        events = [ val for val in outputs if val.iotype=='event' ]
+        extracts = [ val for val in outputs if val.iotype=='time' or val.iotype=='sample' ]
+        try:
+            if len(events) > 0:
+                columns = self.consolidated_columns()
+                if len(self.eldoruns) > 0:
+                    runs = events[0]._read_event_runs(self.eldoprintfile)
+                    for val in events:
+                        parts[val.name] = [ [ run[:,[0,col]] for run in runs ] for col in columns[val.name] ]
+                    del runs
+                else:
+                    arr = events[0]._read_event(self.eldoprintfile)
+                    for val in events:
+                        parts[val.name] = [ arr[:,[0,col]] for col in columns[val.name] ]
+                    del arr
+            if len(extracts) > 0:
+                # Lines are sorted by the node label in one pass. Longest names
+                # are tried first, and a label must not continue with a word character.
+                names = [ ioname.upper() for val in extracts for ioname in val.ionames ]
+                labelmatch = re.compile(r"(?<![\w])(%s)(?![\w])" % \
+                        '|'.join([ re.escape(n) for n in sorted(names,key=len,reverse=True) ]))
+                lines = dict([ (n,[]) for n in names ])
+                with open(self.eldoextractfile) as infile:
+                    for line in infile:
+                        match = labelmatch.search(line)
+                        if match != None:
+                            lines[match.group(1)].append(line)
+                for val in extracts:
+                    for ioname in val.ionames:
+                        src = StringIO(''.join(lines[ioname.upper()]))
+                        if val.iotype=='time':
+                            parts[val.name].append(val._read_time(src,ioname))
+                        else:
+                            parts[val.name].append(val._decode_sample(src,ioname))
+        except:
+            self.print_log(type='F',msg='Failed while reading the consolidated output files.')
+        for val in outputs:
+            val._assemble(parts[val.name])
+
     # Reading output files
     def read_outfile(self):
-        for name, val in self.iofile_bundle.Members.items():
-            if val.dir.lower()=='out' or val.dir.lower()=='output':
-                 self.iofile_bundle.Members[name].read()
+        outputs = [ val for name, val in self.iofile_bundle.Members.items() 
+                if val.dir.lower()=='out' or val.dir.lower()=='output' ]
+        if self.lazy_outputs:
+            if self.preserve_iofiles:
+                for val in outputs:
+                    val.Data = eldo_lazydata(val)
+                    # The file is read at the first access, after the
+                    # iofile_bundle deleter of postprocess_eldo_sim
+                    val.preserve = True
+                return
+            self.print_log(type='W',msg='Lazy outputs require preserve_iofiles=True. Reading outputs now.')
+        if self.consolidate_outputs:
+            self.read_consolidated(outputs)
+            return
+        if self.read_workers > 1:
+            # All files of all outputs are parsed in the same pool, and
+            # assembled in the order of the ionames afterwards
+            tasks = [ (val,i) for val in outputs for i in range(len(val.file)) ]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.read_workers) as executor:
+                futures = [ executor.submit(val._read_file,i) for val, i in tasks ]
+            parts = dict([ (val.name,[]) for val in outputs ])
+            errors = []
+            fatal = None
+            for (val,i), future in zip(tasks,futures):
+                try:
+                    parts[val.name].append(future.result())
+                except SystemExit as e:
+                    # A print_log(type='F') of a worker, logged by the worker
+                    fatal = fatal or e
+                except Exception as e:
+                    errors.append('%s: %s' % (val.file[i],e))
+            if len(errors) > 0:
+                self.print_log(type='E' if fatal is not None else 'F',
+                        msg='Failed while reading %d output files:\n%s' % (len(errors),'\n'.join(errors)))
+            if fatal is not None:
+                raise fatal
+            for val in outputs:
+                val._assemble(parts[val.name])
+        else:
+            for val in outputs:
+                val.read()
     
+    @property
+    def echo_eldo_output(self):
+        """True (default) | False
+
+        Echo the simulator output to stdout while it runs. The output is
+        captured to eldo_exitinfo in both cases."""
+        if hasattr(self,'_echo_eldo_output'):
+            return self._echo_eldo_output
+        else:
+            self._echo_eldo_output=True
+        return self._echo_eldo_output
+    @echo_eldo_output.setter
+    def echo_eldo_output(self,value):
+        self._echo_eldo_output=value
+
+    @property
+    def eldo_exitinfo(self):
+        """Exit information of the latest simulation as a dict with keys
+        'cmd', 'returncode', 'signal' (None unless killed by a signal),
+        'output' (captured stdout and stderr), 'failureclass' (see eldo_retrypolicy),
+        'attempts', 'retries', 'history' (failure class of each attempt), 'elapsed' (s)
+        and 'cached' (results reused from eldo_resultcache)."""
+        if not hasattr(self,'_eldo_exitinfo'):
+            self._eldo_exitinfo=None
+        return self._eldo_exitinfo
+    @eldo_exitinfo.setter
+    def eldo_exitinfo(self,value):
+        self._eldo_exitinfo=value
+
+    @property
+    def eldo_retrypolicy(self):
+        """Retry policy of failed simulations, an eldo_retrypolicy instance.
+        By default license failures and LSF preemptions are retried up to 10 times."""
+        if not hasattr(self,'_eldo_retrypolicy'):
+            self._eldo_retrypolicy=eldo_retrypolicy(self)
+        return self._eldo_retrypolicy
+    @eldo_retrypolicy.setter
+    def eldo_retrypolicy(self,value):
+        self._eldo_retrypolicy=value
+
+    @property
+    def eldo_resultcache(self):
+        """Cache of simulation results, an eldo_resultcache instance.
+        Default None (no caching)."""
+        if not hasattr(self,'_eldo_resultcache'):
+            self._eldo_resultcache=None
+        return self._eldo_resultcache
+    @eldo_resultcache.setter
+    def eldo_resultcache(self,value):
+        self._eldo_resultcache=value
+
+    @property
+    def run_profile(self):
+        """Timing of the phases of the latest run, an eldo_runprofile instance.
+        A new profile is started by prepare_eldo_sim."""
+        if not hasattr(self,'_run_profile'):
+            self._run_profile=eldo_runprofile(self)
+        return self._run_profile
+    @run_profile.setter
+    def run_profile(self,value):
+        self._run_profile=value
+
+    @property
+    def eldo_telemetryfile(self):
+        """File to which the run_profile of each run is appended as a
+        JSON line. Default None (not written)."""
+        if not hasattr(self,'_eldo_telemetryfile'):
+            self._eldo_telemetryfile=None
+        return self._eldo_telemetryfile
+    @eldo_telemetryfile.setter
+    def eldo_telemetryfile(self,value):
+        self._eldo_telemetryfile=value
+
+    # Copies the results of an identical earlier simulation to the simulation 
+    # directory. Returns True on a cache hit.
+    def fetch_cached_results(self):
+        if self.eldo_resultcache is None:
+            return False
+        with self.run_profile.phase('cache_fetch'):
+            self._resultcache_key = self.eldo_resultcache.key()
+            hit = self.eldo_resultcache.fetch(self._resultcache_key)
+        if hit:
+            self.eldo_exitinfo = { 'cmd' : self.eldocmd, 'returncode' : 0, 'signal' : None,
+                    'output' : '', 'failureclass' : 'ok', 'attempts' : 0, 'retries' : 0,
+                    'history' : [], 'elapsed' : 0, 'cached' : True }
+            return True
+        return False
+
+    def store_cached_results(self):
+        if self.eldo_resultcache is not None and self.eldo_exitinfo['returncode'] == 0:
+            with self.run_profile.phase('cache_store'):
+                self.eldo_resultcache.store(self._resultcache_key)
+
+    # Tail of the .chi file for failure classification
+    def _chi_tail(self,nbytes=1<<16):
+        try:
+            with open(self.eldochisrc,'rb') as infile:
+                infile.seek(0,os.SEEK_END)
+                infile.seek(max(0,infile.tell()-nbytes))
+                return infile.read().decode(errors='replace')
+        except OSError:
+            return ''
+
+    # Classifies the outcome of an attempt (unless already known) and returns 
+    # the delay before the next attempt, or None if not retrying
+    def _retry_delay(self,status,output,history,start,failureclass=None):
+        if failureclass is None:
+            failureclass = self.eldo_retrypolicy.classify(status,''.join(output),
+                    self._chi_tail() if status != 0 else '')
+        history.append(failureclass)
+        # Let's not try to restart if in interactive mode
+        if failureclass == 'ok' or self.interactive_eldo:
+            return None
+        delay = self.eldo_retrypolicy.delay(len(history))
+        if not self.eldo_retrypolicy.should_retry(failureclass,len(history),time.time()-start,delay):
+            return None
+        self.print_log(type='W',msg='Eldo failed (%s, %d), trying again in %.1f s... (%d/%d)' \
+                % (failureclass,status,delay,len(history),self.eldo_retrypolicy.maxattempts-1))
+        return delay
+
+    def _set_exitinfo(self,returncode,output,history,start):
+        self.eldo_exitinfo = {
+                'cmd' : self.eldocmd,
+                'returncode' : returncode,
+                'signal' : -returncode if returncode < 0 else None,
+                'output' : ''.join(output),
+                'failureclass' : history[-1],
+                'attempts' : len(history),
+                'retries' : len(history)-1,
+                'history' : history,
+                'elapsed' : time.time()-start,
+                'cached' : False
+                }
+        return self.eldo_exitinfo
+
+    def _check_exitinfo(self):
+        if self.eldo_exitinfo['signal'] is not None:
+            self.print_log(type='F',msg='Eldo was killed by signal %d (%s).' \
+                    % (self.eldo_exitinfo['signal'],self.eldo_exitinfo['failureclass']))
+        elif self.eldo_exitinfo['returncode'] > 0:
+            self.print_log(type='F',msg='Eldo encountered an error (%d, %s).' \
+                    % (self.eldo_exitinfo['returncode'],self.eldo_exitinfo['failureclass']))
+
+    @property
+    def eldo_progressmonitor(self):
+        """Monitor of the simulation progress, an eldo_progressmonitor instance.
+        Default None (no monitoring)."""
+        if not hasattr(self,'_eldo_progressmonitor'):
+            self._eldo_progressmonitor=None
+        return self._eldo_progressmonitor
+    @eldo_progressmonitor.setter
+    def eldo_progressmonitor(self,value):
+        self._eldo_progressmonitor=value
+
+    # Stop time of the transient simulation, None if not known
+    def _tstop(self):
+        for simtype, val in self.simcmd_bundle.Members.items():
+            if str(simtype).lower() == 'tran':
+                if val.tstop is not None:
+                    return val.tstop
+                return getattr(getattr(self,'tb',None),'_trantime',None)
+        return None
+
+    # Kills the process group of a simulation (the shell, the simulator or
+    # the submission command). The simulator runs in a session of its own.
+    def _kill_process(self,pid,grace=5):
+        try:
+            os.killpg(pid,signal.SIGTERM)
+            deadline = time.time()+grace
+            while time.time() < deadline:
+                os.killpg(pid,0)
+                time.sleep(0.1)
+            os.killpg(pid,signal.SIGKILL)
+        except (ProcessLookupError,PermissionError):
+            pass
+
+    # Asyncio version of _kill_process, waits without blocking the event loop
+    async def _kill_process_async(self,pid,grace=5):
+        try:
+            os.killpg(pid,signal.SIGTERM)
+            deadline = time.time()+grace
+            while time.time() < deadline:
+                os.killpg(pid,0)
+                await asyncio.sleep(0.1)
+            os.killpg(pid,signal.SIGKILL)
+        except (ProcessLookupError,PermissionError):
+            pass
+
+    # Shell command of a local simulation with the address space limited
+    # by ulimit. No preexec_fn, which is unsafe in threaded programs.
+    def _limitedcmd(self,cmd):
+        if self.eldo_memlimit is not None and self._eldo_islocal:
+            return 'ulimit -v %d; %s' % (max(1,self.eldo_memlimit//1024),cmd)
+        return cmd
+
+    # Timer killing a local simulation after eldo_timeout. The expired
+    # attribute of the timer tells if it fired.
+    def _start_timeout(self,pid):
+        if self.eldo_timeout is None or not self._eldo_islocal:
+            return None
+        def expire():
+            timer.expired = True
+            self.print_log(type='W',msg='Eldo exceeded the time limit of %g s. Killing the simulation.' % self.eldo_timeout)
+            self._kill_process(pid)
+        timer = threading.Timer(self.eldo_timeout,expire)
+        timer.expired = False
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    # Asyncio version of _start_timeout, a callback of the event loop
+    # instead of a thread. The kill attribute is the task killing the
+    # simulation once the timer has fired.
+    def _start_timeout_async(self,pid):
+        if self.eldo_timeout is None or not self._eldo_islocal:
+            return None
+        def expire():
+            timer.expired = True
+            self.print_log(type='W',msg='Eldo exceeded the time limit of %g s. Killing the simulation.' % self.eldo_timeout)
+            timer.kill = asyncio.ensure_future(self._kill_process_async(pid))
+        handle = asyncio.get_running_loop().call_later(self.eldo_timeout,expire)
+        timer = types.SimpleNamespace(expired=False,kill=None,cancel=handle.cancel)
+        return timer
+
+    # Failure class of a killed or limited attempt, None if not known here
+    def _limit_failureclass(self,status,timer):
+        if timer is not None:
+            timer.cancel()
+            if timer.expired:
+                return 'timeout'
+        # Allocation failures under the address space limit often end in a
+        # signal, seen as a negative status or as 128+signal from the shell
+        if status is not None and self.eldo_memlimit is not None and self._eldo_islocal:
+            sig = -status if status < 0 else status-128 if status > 128 else None
+            if sig in [signal.SIGKILL,signal.SIGSEGV,signal.SIGABRT,signal.SIGBUS]:
+                return 'memory'
+        return None
+
+    def _start_monitor(self,proc):
+        if self.eldo_progressmonitor is not None:
+            self.eldo_progressmonitor.start(self.eldochisrc,self._tstop(),max(len(self.eldoruns),1),
+                    kill=lambda: self._kill_process(proc.pid))
+
+    # Stops the monitor, returns 'stalled' if it killed the simulation
+    def _stop_monitor(self):
+        if self.eldo_progressmonitor is not None:
+            self.eldo_progressmonitor.stop()
+            if self.eldo_progressmonitor.stalled:
+                return 'stalled'
+        return None
+
+    # Time spent in the LSF queue, from the dispatch message of 'bsub -K'
+    def _profile_dispatch(self,line,attemptstart):
+        if line.startswith('<<Starting on'):
+            self.run_profile.add('execute',queue=time.time()-attemptstart)
+
     def execute_eldo_sim(self):
         # Call eldo here
         self.print_log(type='I', msg="Running external command %s\n" %(self.eldocmd) )
     
-        # This is some experimental stuff
-        count = 0
-        while True:
-            status = int(os.system(self.eldocmd)/256)
-            # Status code 9 seems to result from failed licensing in LSF runs
-            # Let's not try to restart if in interactive mode
-            if status != 9 or count == 10 or self.interactive_eldo:
-                break
-            else:
-                count += 1
-                self.print_log(type='W',msg='License error, trying again... (%d/10)' % count)
-                time.sleep(5)
-        if status > 0:
-            self.print_log(type='F',msg='Eldo encountered an error (%d).' % status)
+        history = []
+        start = time.time()
+        with self.run_profile.phase('execute'):
+            while True:
+                output = []
+                attemptstart = time.time()
+                proc = subprocess.Popen(self._limitedcmd(self.eldocmd),shell=True,stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,universal_newlines=True,errors='replace',
+                        start_new_session=True)
+                status = None
+                timer = self._start_timeout(proc.pid)
+                try:
+                    self._start_monitor(proc)
+                    for line in proc.stdout:
+                        output.append(line)
+                        self._profile_dispatch(line,attemptstart)
+                        if self.eldo_progressmonitor is not None:
+                            self.eldo_progressmonitor.feed(line)
+                        if self.echo_eldo_output:
+                            sys.stdout.write(line)
+                    status = proc.wait()
+                except BaseException:
+                    # E.g. KeyboardInterrupt, the simulator is not left running
+                    self._kill_process(proc.pid)
+                    raise
+                finally:
+                    failureclass = self._stop_monitor()
+                    failureclass = self._limit_failureclass(status,timer) or failureclass
+                delay = self._retry_delay(status,output,history,start,failureclass)
+                if delay is None:
+                    break
+                time.sleep(delay)
+        self._set_exitinfo(status,output,history,start)
+        self._check_exitinfo()
+
+    async def execute_eldo_sim_async(self):
+        """Asyncio version of execute_eldo_sim. The simulator runs as a
+        subprocess of the event loop, so a single thread can wait for any
+        number of simulations (e.g. 'bsub -K' submissions) at the same time.
+
+        Returns
+        -------
+        dict
+            eldo_exitinfo
+        """
+        self.print_log(type='I', msg="Running external command %s\n" %(self.eldocmd) )
+        history = []
+        start = time.time()
+        with self.run_profile.phase('execute'):
+            while True:
+                output = []
+                attemptstart = time.time()
+                proc = await asyncio.create_subprocess_shell(self._limitedcmd(self.eldocmd),
+                        stdout=asyncio.subprocess.PIPE,stderr=asyncio.subprocess.STDOUT,
+                        start_new_session=True)
+                status = None
+                timer = self._start_timeout_async(proc.pid)
+                try:
+                    self._start_monitor(proc)
+                    async for line in proc.stdout:
+                        line = line.decode(errors='replace')
+                        output.append(line)
+                        self._profile_dispatch(line,attemptstart)
+                        if self.eldo_progressmonitor is not None:
+                            self.eldo_progressmonitor.feed(line)
+                        if self.echo_eldo_output:
+                            sys.stdout.write(line)
+                    status = await proc.wait()
+                except BaseException:
+                    # E.g. a cancelled task, the simulator is not left running
+                    await self._kill_process_async(proc.pid)
+                    raise
+                finally:
+                    # Joining the monitor thread may take a poll interval
+                    failureclass = await asyncio.get_running_loop().run_in_executor(None,self._stop_monitor)
+                    failureclass = self._limit_failureclass(status,timer) or failureclass
+                    if timer is not None and timer.kill is not None:
+                        await timer.kill
+                delay = self._retry_delay(status,output,history,start,failureclass)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+        self._set_exitinfo(status,output,history,start)
+        self._check_exitinfo()
+        return self.eldo_exitinfo
+
+    @property
+    def eldo_chilog(self):
+        """Parser of the .chi file, an eldo_chilog instance."""
+        if not hasattr(self,'_eldo_chilog'):
+            self._eldo_chilog=eldo_chilog(self)
+        return self._eldo_chilog
+    @eldo_chilog.setter
+    def eldo_chilog(self,value):
+        self._eldo_chilog=value
+
+    @property
+    def measurements(self):
+        """Results of the .extract and .meas statements of the testbench 
+        (including eldomisc) from the .chi file, as a dict of upper case labels.
+        Vector extracts are arrays, and with batched runs (eldoruns) the values
+        have a leading run axis. The file is parsed once, and the result is kept
+        after the file is removed."""
+        tb = getattr(self,'tb',None)
+        labels = self.eldo_chilog.labels(tb.contents) if tb is not None else []
+        return self.eldo_chilog.parse(self.eldochisrc,labels,len(self.eldoruns))
 
     def extract_powers(self):
+        """Currents and powers of the DC sources from the measurements to 
+        dicts self.currents and self.powers. With batched runs (eldoruns), the
+        values are arrays of one value per run."""
         self.powers = {}
         self.currents = {}
         try:
-            currentmatch = re.compile(r"CURRENT_")
-            powermatch = re.compile(r"POWER_")
-            with open(self.eldochisrc) as infile:
-                chifile = infile.readlines()
-                for line in chifile:
-                    if currentmatch.search(line):
-                        words = line.split()
-                        sourcename = words[1].replace('CURRENT_','')
-                        extval = float(words[3])
-                        self.currents[sourcename] = extval
-                        self.print_log(type='I',msg='%s\tcurrent = %g\tA'%(sourcename,extval))
-                    elif powermatch.search(line):
-                        words = line.split()
-                        sourcename = words[1].replace('POWER_','')
-                        extval = float(words[3])
-                        self.powers[sourcename] = extval
-                        self.print_log(type='I',msg='%s\tpower   = %g\tW'%(sourcename,extval))
+            for label, value in self.measurements.items():
+                if label.startswith('CURRENT_'):
+                    self.currents[label.replace('CURRENT_','')] = value
+                elif label.startswith('POWER_'):
+                    self.powers[label.replace('POWER_','')] = value
+            fmt = '%s' if len(self.eldoruns) > 0 else '%g'
+            for sourcename, value in self.currents.items():
+                self.print_log(type='I',msg=('%s\tcurrent = '+fmt+'\tA')%(sourcename,value))
+            for sourcename, value in self.powers.items():
+                self.print_log(type='I',msg=('%s\tpower   = '+fmt+'\tW')%(sourcename,value))
             if len(self.currents.keys()) > 0:
-                self.print_log(type='I',msg='Total\tcurrent = %g\tA'%(sum(self.currents.values())))
-                self.print_log(type='I',msg='Total\tpower   = %g\tW'%(sum(self.powers.values())))
+                self.print_log(type='I',msg=('Total\tcurrent = '+fmt+'\tA')%(sum(self.currents.values())))
+                self.print_log(type='I',msg=('Total\tpower   = '+fmt+'\tW')%(sum(self.powers.values())))
         except:
             self.print_log(type='W',msg='Something went wrong while extracting power consumptions.')
 
-    def run_eldo(self):
-        self.tb = etb(self)
-        self.tb.iofiles = self.iofile_bundle
-        self.tb.dcsources = self.dcsource_bundle
-        self.tb.simcmds = self.simcmd_bundle
-        self.connect_inputs()
-        #self.tb.define_testbench()
-        self.tb.generate_contents()
-        self.tb.export_subckt(force=True)
-        self.tb.export(force=True)
-        self.write_infile()
-        #time.sleep(1)
-        self.execute_eldo_sim()
-        #time.sleep(1)
-        self.extract_powers()
-        self.read_outfile()
-        self.connect_outputs()
+    # Testbench generation and input files
+    def prepare_eldo_sim(self):
+        self.run_profile = eldo_runprofile(self)
+        with self.run_profile.phase('testbench'):
+            reuse = self.reuse_testbench and isinstance(getattr(self,'tb',None),etb)
+            if not reuse:
+                self.tb = etb(self)
+            self.tb.iofiles = self.iofile_bundle
+            self.tb.dcsources = self.dcsource_bundle
+            self.tb.simcmds = self.simcmd_bundle
+            self.connect_inputs()
+            if reuse:
+                self.tb.update()
+            #self.tb.define_testbench()
+            self.tb.generate_contents()
+        with self.run_profile.phase('export_subckt'):
+            self.tb.export_subckt(force=True)
+        with self.run_profile.phase('export'):
+            self.tb.export(force=True)
+        with self.run_profile.phase('write_infile'):
+            self.write_infile()
+
+    # Results and cleanup
+    def postprocess_eldo_sim(self):
+        with self.run_profile.phase('extract_powers'):
+            self.extract_powers()
+        with self.run_profile.phase('read_outfile'):
+            self.read_outfile()
+            self.connect_outputs()
 
         # Calling deleter of iofiles
-        del self.iofile_bundle
+        with self.run_profile.phase('cleanup_iofiles'):
+            del self.iofile_bundle
         # And eldo files (tb, subcircuit, wdb)
-        del self.eldosimpath
+        with self.run_profile.phase('cleanup_eldofiles'):
+            del self.eldosimpath
+
+        total = self.run_profile.total
+        self.print_log(type='I',msg='Run took %.3f s (%s).' % (total['wall'],
+            ', '.join([ '%s %.3f s' % (name,phase['wall']) for name, phase in self.run_profile.phases.items() ])))
+        self.run_profile.write(self.eldo_telemetryfile)
+
+    def run_eldo(self):
+        self.prepare_eldo_sim()
+        if not self.fetch_cached_results():
+            #time.sleep(1)
+            self.execute_eldo_sim()
+            self.store_cached_results()
+        #time.sleep(1)
+        self.postprocess_eldo_sim()
+
+    async def run_eldo_async(self):
+        """Asyncio version of run_eldo. 
+
+        Example
+        -------
+            entities = [ self.sweep_point(p) for p in points ]
+            results = await asyncio.gather(*[ e.run_eldo_async() for e in entities ])
+
+        The testbench generation, the result cache and the parsing of the
+        outputs are file I/O, run in the default executor of the loop so that
+        they do not stall the other simulations.
+
+        Returns
+        -------
+        dict
+            eldo_exitinfo of the simulation.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None,self.prepare_eldo_sim)
+        if not await loop.run_in_executor(None,self.fetch_cached_results):
+            await self.execute_eldo_sim_async()
+            await loop.run_in_executor(None,self.store_cached_results)
+        await loop.run_in_executor(None,self.postprocess_eldo_sim)
+        return self.eldo_exitinfo
+
+    # Copy of the entity for a single sweep point. The copy gets a new runname, 
+    # and thus its own simulation directory.
+    def sweep_point(self,point):
+        entity = deepcopy(self)
+        for attr in ['_runname','_eldosimpath','_eldotbsrc','_eldowdbsrc','_eldochisrc','_eldosubcktsrc','_eldo_dutlink','_eldo_exitinfo']:
+            if attr in entity.__dict__:
+                delattr(entity,attr)
+        # A reused testbench keeps its parsed DUT and the other unchanged sections
+        if not self.reuse_testbench and 'tb' in entity.__dict__:
+            delattr(entity,'tb')
+        for attr in ['eldoparameters','eldocorner','eldooptions']:
+            if attr in point:
+                setattr(entity,attr,dict(getattr(self,attr),**point[attr]))
+        for ioname, data in point.get('inputs',{}).items():
+            entity.IOS.Members[ioname].Data = data
+        return entity
+
+    def sweep(self,points,**kwargs):
+        """Runs eldo simulations for a list of sweep points concurrently.
+
+        Each point is simulated in a copy of this entity with its own
+        runname (and simulation directory), and the results are yielded
+        as the simulations complete.
+
+        Parameters
+        ----------
+        points : list of dict
+            Each point may define 'eldoparameters', 'eldocorner' and 'eldooptions'
+            dicts, which update the corresponding properties of the entity,
+            and 'inputs', a dict of input IO names and Data.
+        **kwargs :
+                workers : int
+                    Maximum number of concurrent simulations. Default 1.
+                executor : str
+                    'thread' (default) or 'process'. The process executor requires
+                    the entity to be picklable, and yields the pickled copies.
+
+        Yields
+        ------
+        dict
+            'index' and 'point' of the sweep point, 'entity' holding the 
+            simulated copy (IOS, powers, currents), 'error', which is None
+            for successful simulations, and 'failureclass' of the simulation
+            (see eldo_retrypolicy, e.g. 'timeout'), None if not known.
+
+        Example
+        -------
+            for result in self.sweep([{'eldoparameters':{'vdd':v}} for v in [0.9,1.0,1.1]],workers=3):
+                out = result['entity'].IOS.Members['out'].Data
+        """
+        workers = kwargs.get('workers',1)
+        if kwargs.get('executor','thread') == 'process':
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        with executor:
+            futures = {}
+            for index, point in enumerate(points):
+                entity = self.sweep_point(point)
+                futures[executor.submit(_run_sweep_point,entity)] = (index,point,entity)
+            for future in concurrent.futures.as_completed(futures):
+                index, point, entity = futures[future]
+                result = { 'index' : index, 'point' : point, 'entity' : None, 'error' : None,
+                        'failureclass' : None }
+                try:
+                    result['entity'] = future.result()
+                except BaseException as e:
+                    self.print_log(type='E',msg='Sweep point %d failed: %s' % (index,e))
+                    result['error'] = e
+                # In process pools, the exit info of a failed point is lost
+                exitinfo = getattr(result['entity'] or entity,'eldo_exitinfo',None)
+                if exitinfo is not None:
+                    result['failureclass'] = exitinfo['failureclass']
+                yield result
+
+    # Job index expression of an LSF job array, e.g. '1-4,7'
+    def _jobindices(self,indices):
+        ranges = []
+        for index in sorted(indices):
+            if len(ranges) > 0 and index == ranges[-1][1]+1:
+                ranges[-1][1] = index
+            else:
+                ranges.append([index,index])
+        return ','.join([ '%d' % a if a == b else '%d-%d' % (a,b) for a, b in ranges ])
+
+    def _arrayfiles(self,arraydir,index):
+        return ('%s/element_%d.status' % (arraydir,index), '%s/element_%d.log' % (arraydir,index))
+
+    # Runs the given elements of a job array and waits for them to finish.
+    # Returns the indices of the elements killed by eldo_timeout or at the
+    # deadline (time.time() value, None for no deadline).
+    def _submit_array(self,driver,arraydir,jobname,indices,workers,poll,deadline=None):
+        stdout = None if self.echo_eldo_output else subprocess.DEVNULL
+        submission = self.eldo_submission
+        if submission.strip() == '':
+            # Local stand-in for the scheduler
+            self.print_log(type='I',msg='Running %d job array elements locally.' % len(indices))
+            def run_element(index):
+                proc = subprocess.Popen(self._limitedcmd(driver),shell=True,stdout=stdout,
+                        env=dict(os.environ,LSB_JOBINDEX=str(index)),
+                        start_new_session=True)
+                timer = self._start_timeout(proc.pid)
+                status = proc.wait()
+                return self._limit_failureclass(status,timer) == 'timeout'
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                expired = list(executor.map(run_element,indices))
+            return set([ i for i, e in zip(indices,expired) if e ])
+        cmd = '%s%s-J "%s[%s]" -o "%s/element_%%I.lsf" %s' % \
+                (submission,self.eldo_submissionlimits,jobname,self._jobindices(indices),arraydir,driver)
+        self.print_log(type='I',msg='Submitting job array: %s' % cmd)
+        proc = subprocess.run(cmd,shell=True,stdout=subprocess.PIPE,stderr=subprocess.STDOUT,
+                universal_newlines=True,errors='replace')
+        if self.echo_eldo_output:
+            sys.stdout.write(proc.stdout)
+        jobid = re.search(r'Job <(\d+)>',proc.stdout)
+        jobid = jobid.group(1) if jobid is not None else None
+        if proc.returncode != 0 and not any([ self._element_finished(arraydir,i) for i in indices ]):
+            self.print_log(type='F',msg='Job array submission failed (%d).' % proc.returncode)
+        # Without -K, the submission returns right after queueing the array
+        if not re.search(r'(^|\s)-K(\s|$)',submission):
+            finished = set()
+            while True:
+                finished |= set([ i for i in indices if self._element_finished(arraydir,i) ])
+                finished |= self._array_finished(jobid,indices)
+                if len(finished) == len(indices):
+                    break
+                if deadline is not None and time.time() > deadline:
+                    unfinished = sorted(set(indices)-finished)
+                    self.print_log(type='W',msg='Job array %s did not finish before the deadline, killing elements %s.' \
+                            % (jobname,self._jobindices(unfinished)))
+                    if jobid is not None:
+                        subprocess.call('bkill "%s[%s]"' % (jobid,self._jobindices(unfinished)),shell=True,
+                                stdout=subprocess.DEVNULL,stderr=subprocess.STDOUT)
+                    return set(unfinished)
+                time.sleep(poll)
+        return set()
+
+    # An element has finished when its driver has written the exit status,
+    # or LSF has written its report (also for elements killed before the
+    # driver could write the status, e.g. TERM_RUNLIMIT or bkill)
+    def _element_finished(self,arraydir,index):
+        return os.path.exists(self._arrayfiles(arraydir,index)[0]) \
+                or os.path.exists('%s/element_%d.lsf' % (arraydir,index))
+
+    # Indices of the elements of a job array in a final state (DONE or
+    # EXIT) according to bjobs. Empty if the state is not available.
+    def _array_finished(self,jobid,indices):
+        if jobid is None:
+            return set()
+        try:
+            output = subprocess.run('bjobs -a -noheader -o "jobindex stat" %s' % jobid,shell=True,
+                    stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,universal_newlines=True,
+                    errors='replace').stdout
+        except OSError:
+            return set()
+        finished = set()
+        for line in output.split('\n'):
+            words = line.split()
+            if len(words) == 2 and words[0].isdigit() and words[1] in ['DONE','EXIT']:
+                finished.add(int(words[0]))
+        return finished & set(indices)
+
+    # Exit status and output of a job array element. The LSF report of the
+    # element (e.g. TERM_RUNLIMIT) is included in the output.
+    def _array_status(self,arraydir,index):
+        statusfile, logfile = self._arrayfiles(arraydir,index)
+        output = []
+        for f in [logfile, '%s/element_%d.lsf' % (arraydir,index)]:
+            try:
+                with open(f,errors='replace') as infile:
+                    output += infile.readlines()
+            except OSError:
+                pass
+        try:
+            with open(statusfile) as infile:
+                status = int(infile.read().strip())
+        except (OSError,ValueError):
+            return 1, output + ['Job array element %d ended without an exit status.\n' % index]
+        return status, output
+
+    def run_eldo_array(self,points,**kwargs):
+        """Runs the simulations of a list of sweep points as a single LSF job array.
+
+        Each point is prepared in a copy of this entity (see sweep_point) with
+        its own simulation directory. The whole array is submitted with a
+        single 'LSFSUBMISSION -J name[1-N]' command, and a driver script runs
+        the simulator command of the element selected by $LSB_JOBINDEX. This
+        avoids the scheduling latency of a job per point. The outputs are read
+        after all elements have finished. Failed elements are resubmitted as a
+        smaller array according to eldo_retrypolicy. Without a submission
+        prefix (simulation in localhost), the elements are run locally with
+        the same driver.
+
+        Parameters
+        ----------
+        points : list of dict
+            Sweep points, see sweep.
+        **kwargs :
+                workers : int
+                    Maximum number of concurrent elements in local runs. Default 1.
+                poll : float
+                    Interval in seconds for polling the exit status of the elements,
+                    if the submission does not wait for the jobs (bsub without -K).
+                    Default 10.
+                deadline : float
+                    Seconds from the submission after which the unfinished elements
+                    are killed and classified as 'timeout', if the submission does not
+                    wait for the jobs. Default 86400.
+
+        Returns
+        -------
+        list of dict
+            'index', 'point', 'entity', 'error' and 'failureclass' of each point, as in sweep.
+
+        Example
+        -------
+            results = self.run_eldo_array([{'eldoparameters':{'vdd':v}} for v in np.linspace(0.8,1.2,41)])
+        """
+        workers = kwargs.get('workers',1)
+        poll = kwargs.get('poll',10)
+        deadline = kwargs.get('deadline',86400)
+        arraydir = self.entitypath + '/Simulations/eldosim/array_' + self.runname
+        if not os.path.exists(arraydir):
+            os.makedirs(arraydir)
+        jobname = '%s_%s' % (self.name,self.runname)
+        results = []
+        elements = {}
+        for index, point in enumerate(points):
+            result = { 'index' : index, 'point' : point, 'entity' : None, 'error' : None,
+                    'failureclass' : None }
+            results.append(result)
+            try:
+                entity = self.sweep_point(point)
+                entity.prepare_eldo_sim()
+                result['entity'] = entity
+                if not entity.fetch_cached_results():
+                    # Job array indices start from 1
+                    elements[index+1] = entity
+            except BaseException as e:
+                self.print_log(type='E',msg='Preparing sweep point %d failed: %s' % (index,e))
+                result['error'] = e
+
+        if len(elements) > 0:
+            with open(arraydir + '/commands.txt','w') as outfile:
+                for result in results:
+                    outfile.write((elements[result['index']+1].eldolocalcmd \
+                            if result['index']+1 in elements else 'true') + '\n')
+            driver = arraydir + '/driver.sh'
+            with open(driver,'w') as outfile:
+                outfile.write('#!/bin/sh\n' +
+                        '# Runs the eldo command of job array element $LSB_JOBINDEX\n' +
+                        'CMD=$(sed -n "${LSB_JOBINDEX}p" "%s/commands.txt")\n' % arraydir +
+                        'sh -c "$CMD" > "%s/element_${LSB_JOBINDEX}.log" 2>&1\n' % arraydir +
+                        'STATUS=$?\n' +
+                        'echo $STATUS > "%s/element_${LSB_JOBINDEX}.status"\n' % arraydir +
+                        'exit $STATUS\n')
+            os.chmod(driver,0o755)
+
+            history = dict([ (i,[]) for i in elements ])
+            start = time.time()
+            pending = sorted(elements)
+            while len(pending) > 0:
+                for i in pending:
+                    for f in self._arrayfiles(arraydir,i)+('%s/element_%d.lsf' % (arraydir,i),):
+                        if os.path.exists(f):
+                            os.remove(f)
+                expired = self._submit_array(driver,arraydir,jobname,pending,workers,poll,
+                        time.time()+deadline if deadline is not None else None)
+                retry = []
+                delays = []
+                for i in pending:
+                    entity = elements[i]
+                    status, output = self._array_status(arraydir,i)
+                    delay = entity._retry_delay(status,output,history[i],start,
+                            'timeout' if i in expired else None)
+                    if delay is None:
+                        entity._set_exitinfo(status,output,history[i],start)
+                        entity.eldo_exitinfo['cmd'] = '%s (element %d of job array %s)' \
+                                % (entity.eldolocalcmd,i,jobname)
+                    else:
+                        retry.append(i)
+                        delays.append(delay)
+                pending = retry
+                if len(pending) > 0:
+                    time.sleep(max(delays))
+            # The elements share the wall-clock time of the array
+            for entity in elements.values():
+                entity.run_profile.add('execute',wall=time.time()-start)
+
+        for result in results:
+            entity = result['entity']
+            if entity is None:
+                continue
+            try:
+                if result['index']+1 in elements:
+                    entity._check_exitinfo()
+                    entity.store_cached_results()
+                entity.postprocess_eldo_sim()
+            except BaseException as e:
+                self.print_log(type='E',msg='Sweep point %d failed: %s' % (result['index'],e))
+                result['error'] = e
+            if entity.eldo_exitinfo is not None:
+                result['failureclass'] = entity.eldo_exitinfo['failureclass']
+        if not self.preserve_eldofiles:
+            shutil.rmtree(arraydir,ignore_errors=True)
+        return results
+
+# Module level for picklability in process pools
+def _run_sweep_point(entity):
+    entity.run_eldo()
+    return entity
 
 
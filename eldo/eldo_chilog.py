@@ -0,0 +1,183 @@
+"""
+=============
+Eldo Chi Log
+=============
+
+One-pass parser of the measurement results in the .chi log of Eldo.
+
+"""
+
+import os
+import sys
+import re
+import numpy as np
+from abc import *
+from thesdk import *
+
+class eldo_chilog(thesdk):
+    """
+    Parser of the .extract and .meas results in a .chi file. The file is
+    read once in large chunks with a single regular expression, which
+    matches the result lines of the given labels (e.g. '* POWER_VDD = 1.2e-03')
+    and the headers of the runs of .step, .alter and Monte Carlo simulations.
+
+    The results are returned as a dict of upper case labels. A single value
+    is returned as a float, repeated values (vector extracts) as an array.
+    For batched runs, the values have a leading run axis (padded with NaN).
+    The latest result is cached by the file size and modification time, and
+    is kept after the file has been removed.
+
+    Example
+    -------
+        chilog = eldo_chilog(self)
+        results = chilog.parse(self.eldochisrc,labels=chilog.labels(self.tb.contents))
+
+    Parameters
+    -----------
+    parent : object
+        The parent object initializing the
+        eldo_chilog instance. Default None
+
+    **kwargs :
+            chunksize : int
+                Bytes read at a time. Default 64 MB.
+    """
+
+    # Header lines of the runs of multi-run simulations
+    runpattern = r"(?:\.?step\b|\.?alter\b|monte ?carlo (?:run|iteration)|run (?:number|#) ?\d+)"
+
+    @property
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,parent=None,**kwargs):
+        try:
+            self.parent = parent
+            self._chunksize=kwargs.get('chunksize',1<<26)
+        except:
+            self.print_log(type='F', msg="Eldo chi log parser definition failed.")
+
+    @property
+    def chunksize(self):
+        if hasattr(self,'_chunksize'):
+            return self._chunksize
+        else:
+            self._chunksize=1<<26
+        return self._chunksize
+    @chunksize.setter
+    def chunksize(self,value):
+        self._chunksize=value
+
+    def labels(self,netlist):
+        """Labels of the .extract (without a file) and .meas statements of a netlist."""
+        labels = []
+        for line in netlist.split('\n'):
+            words = line.split()
+            if len(words) == 0:
+                continue
+            statement = words[0].lower()
+            if statement == '.extract' and not re.search(r"(?i)\bfile\s*=",line):
+                match = re.search(r"(?i)\blabel\s*=\s*([^\s\)]+)",line)
+                if match is not None:
+                    labels.append(match.group(1).upper())
+            elif statement.startswith('.meas') and len(words) > 2:
+                labels.append(words[2].upper())
+        return sorted(set(labels),key=len,reverse=True)
+
+    def _value(self,word):
+        try:
+            return float(word)
+        except ValueError:
+            return np.nan
+
+    def _read(self,fname,labels):
+        if len(labels) > 0:
+            labelmatch = '|'.join([ re.escape(l) for l in labels ])
+        else:
+            # Without known labels, any '* LABEL = value' line is a result
+            labelmatch = r"\w+"
+        linematch = re.compile((r"^(?:[ \t]*\**[ \t]*(?P<label>%s)(?![\w])(?:[ \t]*[\(\[][ \t]*(?P<index>\d+)[ \t]*[\)\]])?" +
+                r"[ \t]*=[ \t]*(?P<value>[^\s,]+)|[ \t*]*(?P<run>%s))") % (labelmatch,self.runpattern),re.M|re.I)
+        runs = [{}]
+        rest = ''
+        with open(fname,errors='replace') as infile:
+            while True:
+                chunk = infile.read(self.chunksize)
+                if not chunk:
+                    text, rest = rest, ''
+                else:
+                    text = rest+chunk
+                    cut = text.rfind('\n')+1
+                    text, rest = text[:cut], text[cut:]
+                for match in linematch.finditer(text):
+                    if match.group('run') is not None:
+                        # A header starts a new run, unless no results were found yet
+                        if len(runs[-1]) > 0:
+                            runs.append({})
+                    else:
+                        runs[-1].setdefault(match.group('label').upper(),[]).append(self._value(match.group('value')))
+                if not chunk:
+                    break
+        return runs
+
+    def _collect(self,runs,nruns):
+        results = {}
+        labels = sorted(set([ l for run in runs for l in run ]))
+        if nruns > 1 and len(runs) == 1:
+            # No run headers, the values of each label are split evenly to the runs
+            split = [ {} for k in range(nruns) ]
+            for label, values in runs[0].items():
+                if len(values) % nruns != 0:
+                    self.print_log(type='W',msg='Found %d values of %s for %d runs.' % (len(values),label,nruns))
+                    continue
+                n = len(values)//nruns
+                for k in range(nruns):
+                    split[k][label] = values[k*n:(k+1)*n]
+            runs = split
+        elif nruns > 1 and len(runs) != nruns:
+            self.print_log(type='W',msg='Found %d runs in the .chi file, expected %d.' % (len(runs),nruns))
+        for label in labels:
+            values = [ run.get(label,[]) for run in runs ]
+            if nruns <= 1 and len(runs) == 1:
+                results[label] = values[0][0] if len(values[0]) == 1 else np.array(values[0])
+            elif max([ len(v) for v in values ]) <= 1:
+                results[label] = np.array([ v[0] if len(v) > 0 else np.nan for v in values ])
+            else:
+                data = np.full((len(values),max([ len(v) for v in values ])),np.nan)
+                for k, v in enumerate(values):
+                    data[k,:len(v)] = v
+                results[label] = data
+        return results
+
+    def parse(self,fname,labels=[],runs=0):
+        """Parses the results of the given labels from a .chi file.
+
+        Parameters
+        ----------
+        fname : str
+            The .chi file.
+        labels : list of str
+            Labels of the results. Default [], all '* LABEL = value' lines.
+        runs : int
+            Number of batched runs, 0 or 1 for a single simulation.
+
+        Returns
+        -------
+        dict
+            Results by upper case label.
+        """
+        labels = [ l.upper() for l in labels ]
+        cached = getattr(self,'_cached',None)
+        try:
+            stat = os.stat(fname)
+        except OSError:
+            if cached is not None and cached[0][0] == fname:
+                return cached[1]
+            self.print_log(type='W',msg='File %s not found.' % fname)
+            return {}
+        key = (fname,stat.st_size,stat.st_mtime_ns,tuple(labels),runs)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        results = self._collect(self._read(fname,labels),runs)
+        self._cached = (key,results)
+        return results
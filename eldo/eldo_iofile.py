@@ -13,6 +13,12 @@ Last modification by Okko Järvinen, 22.01.2020 10:57
 """
 import os
 import sys
+import re
+import time
+import json
+import hashlib
+import tempfile
+import concurrent.futures
 from abc import * 
 from thesdk import *
 from thesdk.iofile import iofile
@@ -69,6 +75,55 @@ class eldo_iofile(iofile):
                 Flag to read the extracted bus as big-endian.
                 Applies only to sample type outputs.
                 Default False.
+            sampleformat : str
+                Output format of the decoded sample type words:
+                'bin' for strings of '0'/'1' characters, 'uint' for unsigned
+                integers or 'int' for two's complement signed integers.
+                Applies only to sample type outputs.
+                Default 'bin'.
+            reader : str
+                Parser used for event type outputs: 'genfromtxt' (numpy.genfromtxt),
+                'pandas' (C engine of pandas.read_csv) or 'numpy' (chunked
+                buffer parser into a pre-sized array). The 'pandas' and 'numpy'
+                readers split the values on any whitespace and return a
+                (rows, columns) array, also for a single row, and fail on
+                values that are not numbers. For printfiles of single space
+                separated values of several rows, they give the result of
+                'genfromtxt'. Default 'genfromtxt', unchanged.
+            readdtype : str
+                Floating point type of the parsed event type outputs: 'float64'/'float32'.
+                Applies only to the 'pandas' and 'numpy' readers.
+                Default 'float64'.
+            writeprecision : int
+                Number of significant digits in the written event type input files.
+                Default None (full precision, '%.18e').
+            writeworkers : int
+                Number of threads writing the files of a multi-node event type input.
+                Default 1.
+            pwlatol : float
+                Absolute error tolerance of the event type input waveform. When given,
+                the points that the linear interpolation of the remaining points
+                reproduces within the tolerance are left out of the input files.
+                Default None (no compression).
+            pwlrtol : float
+                Relative error tolerance of the event type input waveform, see pwlatol.
+                Default None (no compression).
+            inlinelimit : int
+                Maximum length (characters) of a sample type input pattern written
+                inline to the testbench. Longer patterns are written to the
+                input file of the node and included to the testbench.
+                Default 10000.
+            ragged : bool
+                Return time type outputs as a list of 1-D arrays, one for each
+                node, instead of a NaN-padded matrix.
+                Applies only to time type outputs.
+                Default False.
+            readcache : bool
+                Cache the parsed output files as .npy sidecars next to the
+                output files and memory-map them on later reads. The cache
+                is rebuilt when the size, modification time or content of the
+                output file changes. None uses the cache only for preserved
+                iofiles. Default None.
             rs : float
                 Sample rate of the sample type input.
                 Default None.
@@ -98,6 +153,16 @@ class eldo_iofile(iofile):
             self._vth=kwargs.get('vth',0.5)
             self._edgetype=kwargs.get('edgetype','rising')
             self._big_endian=kwargs.get('big_endian',False)
+            self._sampleformat=kwargs.get('sampleformat','bin')
+            self._reader=kwargs.get('reader','genfromtxt')
+            self._readdtype=kwargs.get('readdtype','float64')
+            self._writeprecision=kwargs.get('writeprecision',None)
+            self._writeworkers=kwargs.get('writeworkers',1)
+            self._pwlatol=kwargs.get('pwlatol',None)
+            self._pwlrtol=kwargs.get('pwlrtol',None)
+            self._inlinelimit=kwargs.get('inlinelimit',10000)
+            self._ragged=kwargs.get('ragged',False)
+            self._readcache=kwargs.get('readcache',None)
             self._rs=kwargs.get('rs',None)
             self._vhi=kwargs.get('vhi',1.0)
             self._vlo=kwargs.get('vlo',0)
@@ -163,6 +228,141 @@ class eldo_iofile(iofile):
     def big_endian(self,value):
         self._big_endian=value
 
+    @property
+    def sampleformat(self):
+        """'bin' (default) | 'uint' | 'int'
+
+        Format of the words decoded from sample type outputs."""
+        if hasattr(self,'_sampleformat'):
+            return self._sampleformat
+        else:
+            self._sampleformat='bin'
+        return self._sampleformat
+    @sampleformat.setter
+    def sampleformat(self,value):
+        self._sampleformat=value
+
+    @property
+    def reader(self):
+        """'genfromtxt' (default) | 'pandas' | 'numpy'
+
+        Parser used for event type outputs."""
+        if hasattr(self,'_reader'):
+            return self._reader
+        else:
+            self._reader='genfromtxt'
+        return self._reader
+    @reader.setter
+    def reader(self,value):
+        self._reader=value
+
+    @property
+    def readdtype(self):
+        """'float64' (default) | 'float32'
+
+        Datatype of event type outputs parsed with the 'pandas' or 'numpy' reader."""
+        if hasattr(self,'_readdtype'):
+            return self._readdtype
+        else:
+            self._readdtype='float64'
+        return self._readdtype
+    @readdtype.setter
+    def readdtype(self,value):
+        self._readdtype=value
+
+    @property
+    def writeprecision(self):
+        """Number of significant digits in event type input files. 
+        Default None (full precision)."""
+        if hasattr(self,'_writeprecision'):
+            return self._writeprecision
+        else:
+            self._writeprecision=None
+        return self._writeprecision
+    @writeprecision.setter
+    def writeprecision(self,value):
+        self._writeprecision=value
+
+    @property
+    def writeworkers(self):
+        """Number of threads writing the input files. Default 1."""
+        if hasattr(self,'_writeworkers'):
+            return self._writeworkers
+        else:
+            self._writeworkers=1
+        return self._writeworkers
+    @writeworkers.setter
+    def writeworkers(self,value):
+        self._writeworkers=value
+
+    @property
+    def pwlatol(self):
+        """Absolute error tolerance for compressing event type inputs. 
+        Default None (no compression)."""
+        if hasattr(self,'_pwlatol'):
+            return self._pwlatol
+        else:
+            self._pwlatol=None
+        return self._pwlatol
+    @pwlatol.setter
+    def pwlatol(self,value):
+        self._pwlatol=value
+
+    @property
+    def pwlrtol(self):
+        """Relative error tolerance for compressing event type inputs. 
+        Default None (no compression)."""
+        if hasattr(self,'_pwlrtol'):
+            return self._pwlrtol
+        else:
+            self._pwlrtol=None
+        return self._pwlrtol
+    @pwlrtol.setter
+    def pwlrtol(self,value):
+        self._pwlrtol=value
+
+    @property
+    def inlinelimit(self):
+        """Maximum length of an inline sample type input pattern. Default 10000."""
+        if hasattr(self,'_inlinelimit'):
+            return self._inlinelimit
+        else:
+            self._inlinelimit=10000
+        return self._inlinelimit
+    @inlinelimit.setter
+    def inlinelimit(self,value):
+        self._inlinelimit=value
+
+    @property
+    def ragged(self):
+        """True | False (default)
+
+        Return time type outputs as a list of per-node arrays, and the
+        outputs of batched runs (eldoruns) as a list of per-run arrays."""
+        if hasattr(self,'_ragged'):
+            return self._ragged
+        else:
+            self._ragged=False
+        return self._ragged
+    @ragged.setter
+    def ragged(self,value):
+        self._ragged=value
+
+    @property
+    def readcache(self):
+        """True | False | None (default)
+
+        Cache parsed output files as memory-mapped .npy sidecars.
+        None enables the cache for preserved iofiles only."""
+        if not hasattr(self,'_readcache'):
+            self._readcache=None
+        if self._readcache is None:
+            return self.preserve
+        return self._readcache
+    @readcache.setter
+    def readcache(self,value):
+        self._readcache=value
+
     @property
     def rs(self):
         if hasattr(self,'_rs'):
@@ -263,6 +463,7 @@ class eldo_iofile(iofile):
                 for f in self.file:
                     if os.path.exists(f):
                         os.remove(f)
+                self.purge_cache()
             except:
                 self.print_log(type='W',msg='Failed while removing files for %s.' % self.name)
 
@@ -271,95 +472,429 @@ class eldo_iofile(iofile):
         if self.iotype == 'event':
             try:
                 data = self.Data
-                for i in range(len(self.file)):
-                    np.savetxt(self.file[i],data[:,[2*i,2*i+1]],delimiter=',')
-                    self.print_log(type='I',msg='Writing input file: %s.' % self.file[i])
+                if self.writeworkers > 1 and len(self.file) > 1:
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=self.writeworkers) as executor:
+                        list(executor.map(lambda i: self._write_pwl(self.file[i],data[:,[2*i,2*i+1]]),
+                            range(len(self.file))))
+                else:
+                    for i in range(len(self.file)):
+                        self._write_pwl(self.file[i],data[:,[2*i,2*i+1]])
             except:
                 self.print_log(type='E',msg='Failed while writing files for %s.' % self.name)
         else:
             pass
 
+    # Generating the binary .sigbus pattern of the i:th node. Each word is
+    # followed by a space.
+    def sigbus_pattern(self,i):
+        col = np.asarray(self.Data)[:,i]
+        if np.issubdtype(col.dtype,np.integer) or np.issubdtype(col.dtype,np.bool_):
+            # Bus width from the name, e.g. DATA<7:0>, or from the largest word
+            width = re.search(r"<(\d+):(\d+)>",self.ionames[i])
+            if width is not None:
+                width = abs(int(width.group(1))-int(width.group(2)))+1
+            else:
+                width = max(int(col.max()).bit_length(),1)
+            shifts = np.arange(width-1,-1,-1,dtype=np.uint64)
+            chars = np.empty((len(col),width+1),dtype=np.uint8)
+            chars[:,:width] = ((col.astype(np.uint64)[:,None] >> shifts) & 1) + ord('0')
+            chars[:,width] = ord(' ')
+            return chars.tobytes().decode('ascii')
+        return ' '.join(col.astype(str).tolist()) + ' '
+
+    # Removes the points of a time-value pair array that the piecewise linear
+    # interpolation of the remaining points reproduces within the tolerance
+    def _compress_pwl(self,fname,data):
+        t = data[:,0]
+        v = data[:,1]
+        if len(t) < 3:
+            return data
+        atol = self.pwlatol if self.pwlatol is not None else 0
+        rtol = self.pwlrtol if self.pwlrtol is not None else 0
+        tol = atol + rtol*np.abs(v)
+        # Candidates lie on the line between their neighbours
+        dt = t[2:]-t[:-2]
+        with np.errstate(divide='ignore',invalid='ignore'):
+            line = v[:-2] + (v[2:]-v[:-2])*(t[1:-1]-t[:-2])/dt
+        keep = np.ones(len(t),dtype=bool)
+        keep[1:-1] = ~((dt > 0) & (np.abs(line-v[1:-1]) <= tol[1:-1]))
+        # Steps given as repeated time instants are always kept
+        keep[1:-1] |= (t[1:-1]==t[:-2]) | (t[1:-1]==t[2:])
+        # Errors accumulate over consecutive removed points. Restoring the
+        # worst point of each segment outside the tolerance until none remain.
+        while True:
+            err = np.abs(np.interp(t,t[keep],v[keep])-v)
+            restore = np.flatnonzero((err > tol) & ~keep)
+            if len(restore) == 0:
+                break
+            segment = np.cumsum(keep)[restore]
+            restore = restore[np.lexsort((-err[restore],segment))]
+            segment = np.sort(segment)
+            first = np.r_[True,segment[1:] != segment[:-1]]
+            keep[restore[first]] = True
+        self.print_log(type='I',msg='Compressed %s from %d to %d points (ratio %.2f).' \
+                % (fname,len(t),np.count_nonzero(keep),len(t)/np.count_nonzero(keep)))
+        return data[keep]
+
+    # Writes a time-value pair file like np.savetxt(fname,data,delimiter=','), but
+    # formats a block of rows with a single string operation and writes
+    # the blocks through a large buffer
+    def _write_pwl(self,fname,data,chunkrows=1<<16):
+        if self.pwlatol is not None or self.pwlrtol is not None:
+            data = self._compress_pwl(fname,data)
+        if self.writeprecision is None:
+            fmt = '%.18e'
+        else:
+            fmt = '%%.%de' % (self.writeprecision-1)
+        rowfmt = fmt + ',' + fmt + '\n'
+        with open(fname,'w',buffering=1<<22) as outfile:
+            for start in range(0,data.shape[0],chunkrows):
+                chunk = data[start:start+chunkrows]
+                outfile.write((rowfmt*chunk.shape[0]) % tuple(chunk.ravel().tolist()))
+        self.print_log(type='I',msg='Writing input file: %s.' % fname)
+
+    # Number of batched runs in the output files, 0 for a single simulation
+    @property
+    def runs(self):
+        return len(getattr(self.parent,'eldoruns',[]))
+
+    # Splitting the rows of a multi-run output to runs. A run starts where
+    # the given column (time or sample index) restarts.
+    def _split_runs(self,arr,key,fname,starts=None):
+        # By default a run starts where the key (e.g. time) decreases
+        if starts is None:
+            starts = np.flatnonzero(np.diff(key) < 0)+1
+        runs = np.split(arr,starts) if len(arr) > 0 else []
+        if len(runs) > self.runs:
+            self.print_log(type='F',msg='Found %d runs in %s, expected %d.' % (len(runs),fname,self.runs))
+        elif len(runs) < self.runs:
+            if self.iotype=='event':
+                self.print_log(type='F',msg='Found %d runs in %s, expected %d.' % (len(runs),fname,self.runs))
+            # E.g. a run without threshold crossings cannot be located
+            self.print_log(type='W',msg='Found %d runs in %s, expected %d. Last runs are left empty.' \
+                    % (len(runs),fname,self.runs))
+            runs += [ arr[:0] ]*(self.runs-len(runs))
+        return runs
+
+    # Parsing a multi-run printfile. The header lines are repeated for each
+    # run, so all lines not starting with a number are skipped.
+    def _read_event_runs(self,fname):
+        with open(fname,'rb') as infile:
+            content = re.sub(rb'(?m)^[ \t]*(?![-+.\d])[^\n]*(\n|$)',b'',infile.read())
+        firstline = content[:content.find(b'\n')]
+        ncols = max(len(firstline.split()),1)
+        arr = self._fromstring(content,ncols,fname)
+        return self._split_runs(arr,arr[:,0],fname)
+
+    # Parsing a printfile output (two header lines followed by space separated values)
+    def _read_event(self,fname):
+        tstart = time.time()
+        if self.reader=='genfromtxt':
+            arr = genfromtxt(fname,delimiter=' ',skip_header=2)
+        elif self.reader=='pandas':
+            try:
+                arr = pd.read_csv(fname,sep=r'\s+',header=None,skiprows=2,
+                        dtype=self.readdtype,engine='c',float_precision='round_trip').to_numpy()
+            except pd.errors.EmptyDataError:
+                arr = np.empty((0,1),dtype=self.readdtype)
+        elif self.reader=='numpy':
+            arr = self._read_event_buffered(fname)
+        else:
+            self.print_log(type='F',msg='Reader \'%s\' undefined.' % self.reader)
+        elapsed = time.time()-tstart
+        self.print_log(type='I',msg='Parsed %d rows from %s in %.3f s (%.3g rows/s).' \
+                % (arr.shape[0],fname,elapsed,arr.shape[0]/max(elapsed,1e-9)))
+        return arr
+
+    # Reads the file twice in large chunks: first to count the rows for
+    # pre-sizing the result, then to parse the values in place.
+    def _read_event_buffered(self,fname,chunksize=1<<26):
+        with open(fname,'rb') as infile:
+            infile.readline()
+            infile.readline()
+            datastart = infile.tell()
+            ncols = len(infile.readline().split())
+            if ncols == 0:
+                return np.empty((0,1),dtype=self.readdtype)
+            infile.seek(datastart)
+            nrows = 0
+            last = b'\n'
+            chunk = infile.read(chunksize)
+            while chunk:
+                nrows += chunk.count(b'\n')
+                last = chunk[-1:]
+                chunk = infile.read(chunksize)
+            if last != b'\n':
+                nrows += 1
+            arr = np.empty(nrows*ncols,dtype=self.readdtype)
+            filled = 0
+            rest = b''
+            infile.seek(datastart)
+            while True:
+                chunk = infile.read(chunksize)
+                if chunk:
+                    chunk = rest+chunk
+                    cut = chunk.rfind(b'\n')+1
+                    chunk,rest = chunk[:cut],chunk[cut:]
+                    if not chunk:
+                        # A line longer than the chunk
+                        continue
+                elif rest:
+                    chunk,rest = rest,b''
+                else:
+                    break
+                vals = self._fromstring(chunk,ncols,fname)
+                if filled+vals.size > arr.size:
+                    self.print_log(type='F',msg='Malformed printfile %s.' % fname)
+                arr[filled:filled+vals.size] = vals.ravel()
+                filled += vals.size
+        return arr[:filled].reshape(-1,ncols)
+
+    # Parsing whitespace separated values of whole lines to a (rows, ncols)
+    # array. Fails unless each non-empty line has ncols numbers.
+    def _fromstring(self,text,ncols,fname):
+        # Number of words on each line
+        chars = np.frombuffer(text,dtype=np.uint8)
+        space = chars <= 32
+        words = np.flatnonzero(space[:-1] & ~space[1:])+1
+        if len(chars) > 0 and not space[0]:
+            words = np.concatenate(([0],words))
+        if len(words) == 0:
+            # fromstring reads whitespace as -1
+            return np.empty((0,ncols),dtype=self.readdtype)
+        try:
+            vals = np.fromstring(text,dtype=self.readdtype,sep=' ')
+        except ValueError as e:
+            self.print_log(type='F',msg='Malformed printfile %s: %s' % (fname,e))
+        counts = np.bincount(np.searchsorted(np.flatnonzero(chars == 10),words))
+        if vals.size != len(words) or np.any((counts != 0) & (counts != ncols)):
+            self.print_log(type='F',msg='Malformed printfile %s: expected %d numbers on each line.' \
+                    % (fname,ncols))
+        return vals.reshape(-1,ncols)
+
+    # Decoding a sampled bus from a vector extract file (path or file object)
+    def _decode_sample(self,src,ioname):
+        # One regex pass over the whole file. The bit index and the sample index
+        # are the third and fourth word of a line, the value is the last field.
+        word=r"[\w']+"
+        sep=r"[^\w'\n]+"
+        linematch=re.compile(r"^(?=[^\n]*%s)[^\w'\n]*%s%s%s%s(\d+)%s(\d+)[^\n]*?(\S+)[ \t\r]*$" \
+                % (re.escape(ioname.upper()),word,sep,word,sep,sep),re.M)
+        rec = np.fromregex(src,linematch,
+                dtype=[('bit',np.int64),('samp',np.int64),('val',np.float64)])
+        if rec.size == 0:
+            self.print_log(type='F',msg='No samples of %s found.' % ioname.upper())
+        if self.runs:
+            # The sample index restarts also at each bit of a bit-major file,
+            # so a run starts where the first bit and sample of the file repeat
+            starts = np.flatnonzero((rec['bit'] == rec['bit'][0]) & (rec['samp'] == rec['samp'][0]))[1:]
+            runs = self._split_runs(rec,None,src if isinstance(src,str) else ioname.upper(),starts=starts)
+            return [ self._pack_samples(run,ioname) for run in runs ]
+        return self._pack_samples(rec,ioname)
+
+    # Packing the bits of decoded samples to words
+    def _pack_samples(self,rec,ioname):
+        # Empty run of a batched simulation
+        if rec.size == 0:
+            return np.zeros((0,1),dtype={'uint':np.uint64,'int':np.int64}.get(self.sampleformat,'U1'))
+        minbit = rec['bit'].min()
+        maxbit = rec['bit'].max()
+        nbits = int(maxbit-minbit+1)
+        firstsamp = rec['samp'].min()
+        nsamp = int(rec['samp'].max()-firstsamp+1)
+        bits = np.zeros((nsamp,nbits),dtype=bool)
+        # Values are rounded to bits at the threshold vth
+        bits[rec['samp']-firstsamp,rec['bit']-minbit] = rec['val'] >= self.vth
+        # Columns ordered from the leftmost (most significant) bit onwards
+        if self.big_endian:
+            bits = bits[:,::-1]
+            self.print_log(type='I',msg='Reading %s<%d:%d> from file to %s.'%(ioname.upper(),minbit,maxbit,self.name))
+        else:
+            self.print_log(type='I',msg='Reading %s<%d:%d> from file to %s.'%(ioname.upper(),maxbit,minbit,self.name))
+        if self.sampleformat=='bin':
+            chars = np.where(bits,ord('1'),ord('0')).astype(np.uint8)
+            words = chars.view('S%d' % nbits).ravel().astype('U%d' % nbits)
+        elif self.sampleformat in ['uint','int']:
+            if nbits > 64:
+                self.print_log(type='F',msg='Cannot pack %d-bit bus %s to integers.' % (nbits,ioname.upper()))
+            words = np.zeros(nsamp,dtype=np.uint64)
+            for col in range(nbits):
+                words |= bits[:,col].astype(np.uint64) << np.uint64(nbits-1-col)
+            if self.sampleformat=='int':
+                words = words.astype(np.int64)
+                if nbits < 64:
+                    words[words >= (1 << (nbits-1))] -= (1 << nbits)
+        else:
+            self.print_log(type='F',msg='Sample format \'%s\' undefined.' % self.sampleformat)
+        return words.reshape(-1,1)
+
+    # Parsing the threshold crossing times of a node from a vector extract file
+    # (path or file object)
+    def _read_time(self,src,ioname):
+        nodematch=re.compile(r"%s" % ioname.upper())
+        arr = []
+        with (open(src) if isinstance(src,str) else src) as infile:
+            for line in infile:
+                if nodematch.search(line) != None:
+                    arr.append(float(line.split()[-1]))
+        arr = np.array(arr).reshape(-1,1)
+        if self.runs:
+            return self._split_runs(arr,arr[:,0],src if isinstance(src,str) else ioname.upper())
+        return arr
+
+    # Parsing the output file of the i:th node
+    def _parse_file(self,i):
+        if self.iotype=='event':
+            if self.runs:
+                return self._read_event_runs(self.file[i])
+            return np.array(self._read_event(self.file[i]))
+        elif self.iotype=='time':
+            return self._read_time(self.file[i],self.ionames[i])
+        elif self.iotype=='sample':
+            return self._decode_sample(self.file[i],self.ionames[i])
+        else:
+            self.print_log(type='F',msg='Couldn\'t read file for input type \'%s\'.'%self.iotype)
+
+    # Parsing the output file of the i:th node through the sidecar cache
+    def _read_file(self,i):
+        fname = self.file[i]
+        if not self.readcache:
+            return self._parse_file(i)
+        stat = os.stat(fname)
+        key = { 'size' : stat.st_size, 'mtime' : stat.st_mtime_ns,
+                'options' : '%s %s %s %s %s %s %s' % (self.iotype,self.ionames[i].upper(),
+                    self.readdtype,self.vth,self.big_endian,self.sampleformat,self.runs) }
+        datafile,keyfile = self._cachefiles(fname)
+        try:
+            with open(keyfile) as infile:
+                cached = json.load(infile)
+            valid = cached['size']==key['size'] and cached['options']==key['options'] \
+                    and os.path.exists(datafile)
+            if valid and cached['mtime']!=key['mtime']:
+                # Touched or copied file, the content decides
+                valid = cached['sha1']==self._sha1(fname)
+                if valid:
+                    cached['mtime']=key['mtime']
+                    with open(keyfile,'w') as outfile:
+                        json.dump(cached,outfile)
+            if valid:
+                self.print_log(type='I',msg='Reading %s from cache %s.' % (fname,datafile))
+                arr = np.load(datafile,mmap_mode='c')
+                if self.runs:
+                    return np.split(arr,cached['runs'])
+                return arr
+            self.print_log(type='I',msg='Stale cache for %s, parsing again.' % fname)
+        except (OSError,ValueError,KeyError):
+            pass
+        arr = self._parse_file(i)
+        tmpfile = None
+        try:
+            key['sha1'] = self._sha1(fname)
+            # A temporary file of its own for each writer of the cache
+            with tempfile.NamedTemporaryFile('wb',dir=os.path.dirname(datafile),
+                    prefix=os.path.basename(datafile)+'.',suffix='.tmp',delete=False) as outfile:
+                tmpfile = outfile.name
+                if self.runs:
+                    # Runs are stored concatenated, split at the given rows
+                    key['runs'] = np.cumsum([ len(run) for run in arr[:-1] ]).tolist()
+                    np.save(outfile,np.concatenate(arr))
+                else:
+                    np.save(outfile,arr)
+            os.replace(tmpfile,datafile)
+            with open(keyfile,'w') as outfile:
+                json.dump(key,outfile)
+        except OSError:
+            if tmpfile is not None and os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            self.print_log(type='W',msg='Could not write cache for %s.' % fname)
+        return arr
+
+    def _cachefiles(self,fname):
+        return (fname+'.cache.npy', fname+'.cache.json')
+
+    def _sha1(self,fname):
+        sha = hashlib.sha1()
+        with open(fname,'rb') as infile:
+            for chunk in iter(lambda: infile.read(1<<24),b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def purge_cache(self):
+        """Removes the cached parse results of the output files."""
+        for f in self.file:
+            for cachefile in self._cachefiles(f):
+                try:
+                    if os.path.exists(cachefile):
+                        os.remove(cachefile)
+                        self.print_log(type='I',msg='Removing %s.' % cachefile)
+                except:
+                    self.print_log(type='W',msg='Could not remove %s.' % cachefile)
+
+    # Combining the parsed per-node arrays to Data
+    def _assemble(self,parts):
+        if len(parts) == 0:
+            return
+        if self.runs:
+            # Parts are lists of per-run arrays, combined run by run
+            runs = [ self._combine([ part[k] for part in parts ]) for k in range(self.runs) ]
+            self.Data = runs if self.ragged else self._stack_runs(runs)
+            return
+        if self.iotype=='time' and self.ragged:
+            if isinstance(self.Data,list):
+                parts = self.Data + parts
+            self.Data = [ np.asarray(p).ravel() for p in parts ]
+            return
+        if self.Data is not None:
+            parts.insert(0,self.Data)
+        self.Data = self._combine(parts)
+
+    # Combining per-node arrays column-wise. The final shape is known
+    # before copying, so the columns are filled to a single preallocated
+    # array with one copy of each part. The parsed parts are held until the
+    # result is complete, so the peak memory is about two copies of the
+    # result (less for parts memory-mapped from the read cache).
+    def _combine(self,parts):
+        if len(parts) == 1:
+            return parts[0]
+        nrows = [ p.shape[0] for p in parts ]
+        ncols = sum([ p.shape[1] for p in parts ])
+        if self.iotype=='time':
+            # Shorter columns are padded with NaN
+            data = np.full((max(nrows),ncols),np.nan)
+        elif min(nrows) != max(nrows):
+            self.print_log(type='F',msg='Output files of %s have different lengths %s.' % (self.name,nrows))
+        else:
+            data = np.empty((nrows[0],ncols),dtype=np.result_type(*parts))
+        col = 0
+        for part in parts:
+            data[:part.shape[0],col:col+part.shape[1]] = part
+            col += part.shape[1]
+        return data
+
+    # Stacking the runs of a batched simulation along a leading axis.
+    # Shorter runs are padded with NaN (zeros for integer and empty
+    # strings for binary samples).
+    def _stack_runs(self,runs):
+        shape = (len(runs),max([ run.shape[0] for run in runs ]),runs[0].shape[1])
+        dtype = np.result_type(*runs)
+        if dtype.kind in 'fc':
+            data = np.full(shape,np.nan,dtype=dtype)
+        else:
+            data = np.zeros(shape,dtype=dtype)
+        for k, run in enumerate(runs):
+            data[k,:run.shape[0],:] = run
+        return data
+
     # Overloaded read from thesdk.iofile
     def read(self,**kwargs):
+        if getattr(self.parent,'consolidate_outputs',False):
+            # The shared output files are parsed by the parent
+            self.parent.read_consolidated([self])
+            return
+        parts = []
         for i in range(len(self.file)):
             try:
-                if self.iotype=='event':
-                    arr = genfromtxt(self.file[i],delimiter=' ',skip_header=2)
-                    if self.Data is None: 
-                        self.Data = np.array(arr)
-                    else:
-                        self.Data = np.hstack((self.Data,np.array(arr)))
-                elif self.iotype=='time':
-                    nodematch=re.compile(r"%s" % self.ionames[i].upper())
-                    with open(self.file[i]) as infile:
-                        wholefile=infile.readlines()
-                        arr = []
-                        for line in wholefile:
-                            if nodematch.search(line) != None:
-                                arr.append(float(line.split()[-1]))
-                        nparr = np.array(arr).reshape(-1,1)
-                        if self.Data is None: 
-                            self.Data = nparr
-                        else:
-                            if len(self.Data[:,-1]) > len(nparr):
-                                # Old max length is bigger -> padding new array
-                                nans = np.empty(self.Data[:,-1].shape).reshape(-1,1)
-                                nans.fill(np.nan)
-                                nans[:nparr.shape[0],:nparr.shape[1]] = nparr
-                                nparr = nans
-                            elif len(self.Data[:,-1]) < len(nparr):
-                                # Old max length is smaller -> padding old array
-                                nans = np.empty((nparr.shape[0],self.Data.shape[1]))
-                                nans.fill(np.nan)
-                                nans[:self.Data.shape[0],:self.Data.shape[1]] = self.Data
-                                self.Data = nans
-                            self.Data = np.hstack((self.Data,nparr))
-                    infile.close()
-                elif self.iotype=='sample':
-                    nodematch=re.compile(r"%s" % self.ionames[i].upper())
-                    with open(self.file[i]) as infile:
-                        wholefile=infile.readlines()
-                        maxsamp = -1
-                        outbus = {}
-                        for line in wholefile:
-                            if nodematch.search(line) != None:
-                                tokens = re.findall(r"[\w']+",line)
-                                bitidx = tokens[2]
-                                sampidx = tokens[3]
-                                if int(sampidx) > maxsamp:
-                                    maxsamp = int(sampidx)
-                                bitval = line.split()[-1]
-                                # TODO: Rounding to bits is done here (might need to go elsewhere)
-                                # Also, not all sampled signals need to be output as bits necessarily
-                                if float(bitval) >= self.vth:
-                                    bitval = '1'
-                                else:
-                                    bitval = '0'
-                                if bitidx in outbus.keys():
-                                    outbus[bitidx].append(bitval)
-                                else:
-                                    outbus.update({bitidx:[bitval]})
-                        maxbit = max(map(int,outbus.keys()))
-                        minbit = min(map(int,outbus.keys()))
-                        if self.big_endian:
-                            bitrange = range(maxbit,minbit-1,-1)
-                            self.print_log(type='I',msg='Reading %s<%d:%d> from file to %s.'%(self.ionames[i].upper(),minbit,maxbit,self.name))
-                        else:
-                            bitrange = range(minbit,maxbit+1,1)
-                            self.print_log(type='I',msg='Reading %s<%d:%d> from file to %s.'%(self.ionames[i].upper(),maxbit,minbit,self.name))
-                        arr = []
-                        for idx in range(maxsamp):
-                            word = ''
-                            for key in bitrange:
-                                word += outbus[str(key)][idx]
-                            arr.append(word)
-                        if self.Data is None: 
-                            self.Data = np.array(arr).reshape(-1,1)
-                        else:
-                            self.Data = np.hstack((self.Data,np.array(arr).reshape(-1,1)))
-                    infile.close()
-                else:
-                    self.print_log(type='F',msg='Couldn\'t read file for input type \'%s\'.'%self.iotype)
+                parts.append(self._read_file(i))
             except:
                 self.print_log(type='F',msg='Failed while reading files for %s.' % self.name)
-
+        self._assemble(parts)
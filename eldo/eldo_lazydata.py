@@ -0,0 +1,95 @@
+"""
+=================
+Eldo Lazy Data
+=================
+
+Deferred handle for the Data of eldo output iofiles. 
+
+The output file is parsed on the first access of the data, which
+requires the output files to be preserved after the simulation.
+
+"""
+
+import os
+import sys
+from abc import * 
+from thesdk import *
+import numpy as np
+
+class eldo_lazydata(thesdk):
+    """
+    Placeholder for the Data of an output eldo_iofile. Reading the
+    `Data` attribute, indexing, or any ndarray attribute (shape, dtype,...) parses
+    the output files of the iofile and replaces the handle in the
+    iofile and in the bound IOs with the parsed array.
+
+    Example
+    -------
+    Enabled in the parent as:
+        self.preserve_iofiles=True
+        self.lazy_outputs=True
+
+    Accessed as:
+        self.IOS.Members['out'].Data[:,1]
+        np.array(self.IOS.Members['out'].Data)
+
+    Parameters
+    -----------
+    iofile : eldo_iofile
+        The output iofile to be read on demand.
+    """
+
+    @property
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,iofile):
+        self._iofile = iofile
+        self._bound = []
+        self._data = None
+
+    def bind(self,io):
+        """Replace the Data of io with the parsed array once read."""
+        self._bound.append(io)
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def Data(self):
+        if self._data is None:
+            self.print_log(type='I',msg='Reading deferred output %s.' % self._iofile.name)
+            self._iofile.Data = None
+            self._iofile.read()
+            self._data = self._iofile.Data
+            for io in self._bound:
+                io.Data = self._data
+        return self._data
+
+    def __array__(self,dtype=None,copy=None):
+        if dtype is None:
+            return np.asarray(self.Data)
+        return np.asarray(self.Data,dtype=dtype)
+
+    def __getitem__(self,key):
+        return self.Data[key]
+
+    def __len__(self):
+        return len(self.Data)
+
+    def __iter__(self):
+        return iter(self.Data)
+
+    # Only ndarray attributes are forwarded, so that probing for other
+    # attributes does not trigger the read
+    def __getattr__(self,name):
+        if name.startswith('_') or not hasattr(np.ndarray,name):
+            raise AttributeError(name)
+        return getattr(self.Data,name)
+
+    def __repr__(self):
+        if self._data is None:
+            return '<eldo_lazydata of %s (not read)>' % self._iofile.name
+        return repr(self._data)
+
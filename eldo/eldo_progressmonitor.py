@@ -0,0 +1,267 @@
+"""
+=========================
+Eldo Progress Monitor
+=========================
+
+Progress reporting and stall detection of running Eldo simulations.
+
+"""
+
+import os
+import sys
+import re
+import time
+import threading
+from abc import *
+from thesdk import *
+
+class eldo_progressmonitor(thesdk):
+    """
+    Monitor of a running transient simulation. The simulated time is parsed
+    from the simulator output and the .chi file, and compared to the stop time
+    of the transient. The progress (percent complete and ETA) is reported
+    periodically through print_log, or through the callback if given.
+
+    If stalltime is set, the simulation is killed when the simulated time has
+    not advanced for stalltime seconds, e.g. due to a timestep collapse. The
+    stall timer starts from the first reported simulated time, so the time
+    spent in the LSF queue or waiting for a license is not a stall. A killed
+    simulation is classified as 'stalled'.
+
+    Example
+    -------
+    Set in parent as:
+        self.eldo_progressmonitor=eldo_progressmonitor(self,interval=300,stalltime=1800)
+
+    Parameters
+    -----------
+    parent : object
+        The parent object initializing the
+        eldo_progressmonitor instance. Default None
+
+    **kwargs :
+            interval : float
+                Reporting interval in seconds. Default 60.
+            stalltime : float
+                Seconds without progress after which the simulation is killed.
+                Default None (never killed).
+            poll : float
+                Interval in seconds for reading the .chi file. Default 1.
+            callback : callable
+                Called at each report with a dict of 'simtime', 'tstop', 'run',
+                'runs', 'fraction', 'elapsed' and 'eta' (seconds, None if unknown).
+                Replaces the print_log report. Default None.
+    """
+
+    # Simulated time in the output or .chi file. CPU and other times are excluded.
+    timepattern = r"(?i)(?<!cpu )(?<!elapsed )(?<!real )\b(?:transient |simulation )?time\s*=\s*" + \
+            r"([-+]?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?)(meg|[fpnumkgt])?\b"
+
+    scales = { 'f' : 1e-15, 'p' : 1e-12, 'n' : 1e-9, 'u' : 1e-6, 'm' : 1e-3,
+            'k' : 1e3, 'meg' : 1e6, 'g' : 1e9, 't' : 1e12 }
+
+    @property
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,parent=None,**kwargs):
+        try:
+            self.parent = parent
+            self._interval=kwargs.get('interval',60)
+            self._stalltime=kwargs.get('stalltime',None)
+            self._poll=kwargs.get('poll',1)
+            self._callback=kwargs.get('callback',None)
+            self.stalled=False
+        except:
+            self.print_log(type='F', msg="Eldo progress monitor definition failed.")
+
+    @property
+    def interval(self):
+        if hasattr(self,'_interval'):
+            return self._interval
+        else:
+            self._interval=60
+        return self._interval
+    @interval.setter
+    def interval(self,value):
+        self._interval=value
+
+    @property
+    def stalltime(self):
+        if hasattr(self,'_stalltime'):
+            return self._stalltime
+        else:
+            self._stalltime=None
+        return self._stalltime
+    @stalltime.setter
+    def stalltime(self,value):
+        self._stalltime=value
+
+    @property
+    def poll(self):
+        if hasattr(self,'_poll'):
+            return self._poll
+        else:
+            self._poll=1
+        return self._poll
+    @poll.setter
+    def poll(self,value):
+        self._poll=value
+
+    @property
+    def callback(self):
+        if hasattr(self,'_callback'):
+            return self._callback
+        else:
+            self._callback=None
+        return self._callback
+    @callback.setter
+    def callback(self,value):
+        self._callback=value
+
+    def spicefloat(self,value):
+        """Value of a number with an optional SPICE scale suffix (e.g. '10n'),
+        or None."""
+        match = re.match(r"(?i)\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?)(meg|[fpnumkgt])?",str(value))
+        if match is None:
+            return None
+        return float(match.group(1))*self.scales.get((match.group(2) or '').lower(),1)
+
+    def start(self,chifile,tstop,runs=1,kill=None):
+        """Starts monitoring a simulation.
+
+        Parameters
+        ----------
+        chifile : str
+            The .chi file of the simulation.
+        tstop : float or str
+            Stop time of the transient, or None if unknown.
+        runs : int
+            Number of batched runs (the simulated time restarts for each run).
+        kill : callable
+            Called without arguments to kill a stalled simulation.
+        """
+        self.stalled = False
+        self._chifile = chifile
+        self._tstop = self.spicefloat(tstop) if tstop is not None else None
+        self._runs = max(runs,1)
+        self._kill = kill
+        self._run = 0
+        self._simtime = None
+        self._started = time.time()
+        self._firstprogress = None
+        self._lastadvance = None
+        self._offset = 0
+        self._rest = ''
+        self._source = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._monitor,daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops monitoring. The .chi file is read once more."""
+        if getattr(self,'_thread',None) is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._tail()
+        self._thread = None
+        self._stop = None
+        self._lock = None
+        self._kill = None
+
+    def feed(self,line,source='output'):
+        """Parses a line of simulator output."""
+        for match in re.finditer(self.timepattern,line):
+            self._update(float(match.group(1))*self.scales.get((match.group(2) or '').lower(),1),source)
+
+    # New simulated time. A decreasing time starts the next batched run.
+    # The output and the .chi file are not in sync, so only the first
+    # source reporting the time is followed.
+    def _update(self,simtime,source):
+        with self._lock:
+            if self._source is None:
+                self._source = source
+            elif source != self._source:
+                return
+            self._advance(simtime)
+
+    def _advance(self,simtime):
+        now = time.time()
+        if self._simtime is not None and simtime < self._simtime:
+            self._run = min(self._run+1,self._runs-1)
+        if self._simtime is None or simtime != self._simtime:
+            self._lastadvance = now
+        self._simtime = simtime
+        if self._firstprogress is None:
+            self._firstprogress = (now,self.fraction or 0)
+
+    @property
+    def fraction(self):
+        """Completed fraction of the simulation (all runs), or None if unknown."""
+        if getattr(self,'_simtime',None) is None or not self._tstop:
+            return None
+        return (self._run+min(self._simtime/self._tstop,1.0))/self._runs
+
+    @property
+    def progress(self):
+        """Current progress as reported to the callback."""
+        fraction = self.fraction
+        now = time.time()
+        eta = None
+        if fraction is not None and self._firstprogress is not None:
+            first, firstfraction = self._firstprogress
+            if fraction > firstfraction and now > first:
+                eta = (1-fraction)*(now-first)/(fraction-firstfraction)
+        return { 'simtime' : self._simtime, 'tstop' : self._tstop, 'run' : self._run+1,
+                'runs' : self._runs, 'fraction' : fraction, 'elapsed' : now-self._started, 'eta' : eta }
+
+    # Reads the new lines of the .chi file
+    def _tail(self):
+        try:
+            with open(self._chifile,errors='replace') as infile:
+                if os.fstat(infile.fileno()).st_size < self._offset:
+                    # Rewritten by a new attempt
+                    self._offset = 0
+                    self._rest = ''
+                infile.seek(self._offset)
+                data = self._rest + infile.read()
+                self._offset = infile.tell()
+        except OSError:
+            return
+        lines = data.split('\n')
+        self._rest = lines.pop()
+        for line in lines:
+            self.feed(line,'chi')
+
+    def report(self):
+        progress = self.progress
+        if self.callback is not None:
+            self.callback(progress)
+        elif progress['simtime'] is None:
+            self.print_log(type='I',msg='Waiting for the simulation to start (%.0f s).' % progress['elapsed'])
+        elif progress['fraction'] is None:
+            self.print_log(type='I',msg='Simulated time %g s.' % progress['simtime'])
+        else:
+            self.print_log(type='I',msg='Simulated time %g s of %g s%s, %.1f %% complete%s.' \
+                    % (progress['simtime'],progress['tstop'],
+                        ' in run %d/%d' % (progress['run'],progress['runs']) if progress['runs'] > 1 else '',
+                        100*progress['fraction'],
+                        ', ETA %.0f s' % progress['eta'] if progress['eta'] is not None else ''))
+
+    def _monitor(self):
+        lastreport = time.time()
+        while not self._stop.wait(self.poll):
+            self._tail()
+            now = time.time()
+            if now-lastreport >= self.interval:
+                self.report()
+                lastreport = now
+            if self.stalltime is not None and self._lastadvance is not None \
+                    and now-self._lastadvance > self.stalltime and not self.stalled:
+                self.print_log(type='W',msg='Simulated time has not advanced from %g s in %.0f s. Killing the simulation.' \
+                        % (self._simtime,now-self._lastadvance))
+                self.stalled = True
+                if self._kill is not None:
+                    self._kill()
@@ -0,0 +1,245 @@
+"""
+=================
+Eldo Result Cache
+=================
+
+Content-addressed cache of Eldo simulation results.
+
+A simulation is identified by a hash of the generated testbench, the exported
+subcircuit, the input files and the simulator command. When the cache holds
+the outputs of an identical simulation, they are copied to the simulation
+directory instead of running the simulator.
+
+"""
+
+import os
+import sys
+import re
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+from abc import * 
+from thesdk import *
+
+class eldo_resultcache(thesdk):
+    """
+    Content-addressed cache of eldo simulation outputs. Each entry is a 
+    directory named by the hash of the simulation inputs, holding the
+    output files and the .chi file. The least recently used entries are
+    evicted when the total size exceeds `maxsize`.
+
+    Included files referenced through eldomisc or the model library are
+    identified by their path only.
+
+    Example
+    -------
+    Set in parent as: 
+        self.eldo_resultcache=eldo_resultcache(self,path='/tmp/eldocache',maxsize=20e9)
+
+    Parameters
+    -----------
+    parent : object 
+        The parent object initializing the 
+        eldo_resultcache instance. Default None
+    
+    **kwargs :  
+            path : str
+                Cache directory. Default '<entitypath>/Simulations/eldocache'.
+            maxsize : float
+                Maximum total size of the cache in bytes. Default 10e9.
+            bypass : bool
+                Always run the simulator, but store the results. Default False.
+    """
+
+    @property
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,parent=None,**kwargs):
+        try:  
+            self.parent = parent
+            self._path=kwargs.get('path',None)
+            self._maxsize=kwargs.get('maxsize',10e9)
+            self._bypass=kwargs.get('bypass',False)
+        except:
+            self.print_log(type='F', msg="Eldo result cache definition failed.")
+
+    @property
+    def path(self):
+        if not hasattr(self,'_path') or self._path is None:
+            self._path=self.parent.entitypath + '/Simulations/eldocache'
+        if not os.path.exists(self._path):
+            os.makedirs(self._path,exist_ok=True)
+        return self._path
+    @path.setter
+    def path(self,value):
+        self._path=value
+
+    @property
+    def maxsize(self):
+        if hasattr(self,'_maxsize'):
+            return self._maxsize
+        else:
+            self._maxsize=10e9
+        return self._maxsize
+    @maxsize.setter
+    def maxsize(self,value):
+        self._maxsize=value
+
+    @property
+    def bypass(self):
+        if hasattr(self,'_bypass'):
+            return self._bypass
+        else:
+            self._bypass=False
+        return self._bypass
+    @bypass.setter
+    def bypass(self,value):
+        self._bypass=value
+
+    def _update_file(self,sha,fname):
+        with open(fname,'rb') as infile:
+            for chunk in iter(lambda: infile.read(1<<24),b''):
+                sha.update(chunk)
+
+    # Content hash of a DUT file, computed once per size and mtime
+    _dutdigests = {}
+    def _dutdigest(self,fname):
+        fname = os.path.realpath(fname)
+        try:
+            stat = os.stat(fname)
+        except OSError:
+            return ''
+        filekey = (fname,stat.st_size,stat.st_mtime_ns)
+        if filekey not in self._dutdigests:
+            sha = hashlib.sha256()
+            self._update_file(sha,fname)
+            self._dutdigests[filekey] = sha.hexdigest()
+        return self._dutdigests[filekey]
+
+    # Run specific paths are replaced with placeholders, so that identical
+    # simulations in different run directories get the same key
+    def _normalize(self,text):
+        for name, val in self.parent.iofile_bundle.Members.items():
+            for k, f in enumerate(val.file):
+                text = text.replace(f,'<%s:%d>' % (name,k))
+        text = text.replace(self.parent.eldosimpath,'<eldosimpath>')
+        return re.sub(r"\*+ Generated .*\n","",text)
+
+    def key(self):
+        """Hash of the simulation inputs of the parent. Call after the 
+        testbench, the subcircuit and the input files are written."""
+        sha = hashlib.sha256()
+        sha.update(self._normalize(self.parent.tb.contents).encode())
+        sha.update(self._normalize(self.parent.eldocmd).encode())
+        if os.path.isfile(self.parent.eldosubcktsrc):
+            if getattr(self.parent,'eldo_dutinclude','copy') == 'copy':
+                self._update_file(sha,self.parent.eldosubcktsrc)
+            else:
+                # A wrapper including the DUT file (or a link to it in the
+                # run directory), the DUT file is hashed as well
+                with open(self.parent.eldosubcktsrc,errors='replace') as infile:
+                    sha.update(self._normalize(infile.read()).encode())
+                sha.update(self._dutdigest(self.parent.tb._dutfile).encode())
+        for name, val in self.parent.iofile_bundle.Members.items():
+            if val.dir.lower()=='in' or val.dir.lower()=='input':
+                for f in val.file:
+                    if os.path.isfile(f):
+                        sha.update(('<%s>' % self._normalize(f)).encode())
+                        self._update_file(sha,f)
+        return sha.hexdigest()
+
+    # Output files of the parent, keyed by their role
+    def outputs(self):
+        files = { 'chi' : self.parent.eldochisrc }
+        for name, val in self.parent.iofile_bundle.Members.items():
+            if val.dir.lower()=='out' or val.dir.lower()=='output':
+                for k, f in enumerate(val.file):
+                    files['%s_%d' % (name,k)] = f
+        if self.parent.consolidate_outputs:
+            files['printfile'] = self.parent.eldoprintfile
+            files['extractfile'] = self.parent.eldoextractfile
+        return files
+
+    def fetch(self,key):
+        """Copies the cached outputs of key to the simulation directory.
+        Returns True on a cache hit."""
+        if self.bypass:
+            return False
+        entry = os.path.join(self.path,key)
+        manifest = os.path.join(entry,'manifest.json')
+        if not os.path.isfile(manifest):
+            return False
+        try:
+            with open(manifest) as infile:
+                cached = json.load(infile)
+            outputs = self.outputs()
+            if not set(outputs.keys()) <= set(cached['files'].keys()):
+                return False
+            for role, f in outputs.items():
+                shutil.copyfile(os.path.join(entry,role),f)
+            # Recently used
+            os.utime(manifest)
+        except (OSError,ValueError,KeyError):
+            # E.g. evicted by another run after the check, a miss
+            return False
+        self.print_log(type='I',msg='Reusing cached results %s.' % entry)
+        return True
+
+    def store(self,key):
+        """Stores the outputs of the parent simulation under key and evicts the least
+        recently used entries beyond maxsize."""
+        entry = os.path.join(self.path,key)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry,ignore_errors=True)
+        tmpentry = None
+        try:
+            # A directory of its own for each writer, concurrent runs may
+            # store the same key
+            os.makedirs(self.path,exist_ok=True)
+            tmpentry = tempfile.mkdtemp(dir=self.path,prefix=key+'.')
+            # mkdtemp allows only the owner, the cache may be shared
+            os.chmod(tmpentry,0o755)
+            files = {}
+            for role, f in self.outputs().items():
+                if os.path.isfile(f):
+                    shutil.copyfile(f,os.path.join(tmpentry,role))
+                    files[role] = os.path.getsize(f)
+            with open(os.path.join(tmpentry,'manifest.json'),'w') as outfile:
+                json.dump({ 'files' : files, 'size' : sum(files.values()), 
+                    'created' : time.time() },outfile)
+            os.rename(tmpentry,entry)
+            self.print_log(type='I',msg='Storing results to cache %s.' % entry)
+        except OSError:
+            if tmpentry is not None:
+                shutil.rmtree(tmpentry,ignore_errors=True)
+            if os.path.isdir(entry):
+                self.print_log(type='I',msg='Results already stored to cache %s.' % entry)
+            else:
+                self.print_log(type='W',msg='Could not store results to cache %s.' % entry)
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in maxsize."""
+        entries = []
+        for key in os.listdir(self.path):
+            manifest = os.path.join(self.path,key,'manifest.json')
+            try:
+                with open(manifest) as infile:
+                    entries.append((os.path.getmtime(manifest),json.load(infile)['size'],key))
+            except (OSError,ValueError,KeyError):
+                pass
+        total = sum([ e[1] for e in entries ])
+        for used, size, key in sorted(entries):
+            if total <= self.maxsize:
+                break
+            shutil.rmtree(os.path.join(self.path,key),ignore_errors=True)
+            total -= size
+            self.print_log(type='I',msg='Evicting cached results %s.' % key)
+
+    def purge(self):
+        """Removes all entries of the cache."""
+        shutil.rmtree(self.path,ignore_errors=True)
+
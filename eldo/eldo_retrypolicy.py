@@ -0,0 +1,213 @@
+"""
+=================
+Eldo Retry Policy
+=================
+
+Classification of failed Eldo runs and the retry policy of the
+transient failures.
+
+"""
+
+import os
+import sys
+import re
+import random
+from abc import * 
+from thesdk import *
+
+class eldo_retrypolicy(thesdk):
+    """
+    Retry policy of eldo simulations. Failed runs are classified from the
+    exit code, the simulator output and the tail of the .chi file as
+    'timeout', 'memory', 'license', 'preemption', 'convergence', 'netlist' or 'unknown'.
+    Runs killed by the wall-clock limit or the stall detection of the parent
+    are classified as 'timeout' and 'stalled'.
+    Only the classes listed in `retry` are retried, with exponential backoff
+    and random jitter, until `maxattempts` or the wall-clock `budget` is exhausted.
+
+    Example
+    -------
+    Set in parent as: 
+        self.eldo_retrypolicy=eldo_retrypolicy(self,maxattempts=20,budget=3600)
+
+    Parameters
+    -----------
+    parent : object 
+        The parent object initializing the 
+        eldo_retrypolicy instance. Default None
+    
+    **kwargs :  
+            maxattempts : int
+                Maximum number of simulation attempts. Default 11.
+            basedelay : float
+                Delay before the first retry in seconds. Default 5.
+            backoff : float
+                Multiplier of the delay for each further retry. Default 2.
+            maxdelay : float
+                Upper limit of the delay in seconds. Default 300.
+            jitter : float
+                Fraction of the delay that is randomized, 0...1. With the default
+                1.0 the delay is drawn uniformly from [0,delay] (full jitter),
+                which spreads out jobs that failed at the same time.
+            budget : float
+                Maximum wall-clock time in seconds from the first attempt after which
+                no more retries are started. Default None (unlimited).
+            retry : list of str
+                Failure classes that are retried. Default ['license','preemption'].
+    """
+
+    # Patterns of the failure classes, checked in this order
+    patterns = [
+            ('timeout', r"TERM_RUNLIMIT|run ?limit (reached|exceeded)"),
+            ('memory', r"TERM_MEMLIMIT|TERM_SWAP|out of memory|cannot allocate memory|bad_alloc|"
+                r"memory allocation (failed|failure|error)|(not enough|insufficient) memory"),
+            # The license checkout is logged on every run, so a failure
+            # word on the same line is required
+            ('license', r"licen[cs]e.{0,80}\b(not available|unavailable|denied|error|fail(s|ed|ure)?|expired)\b|"
+                r"(unable to|cannot|could not|failed to) (check ?out|obtain|get).{0,40}licen[cs]e|"
+                r"(check ?out|flexnet|flexlm|lmgrd).{0,80}\b(not available|unavailable|denied|error|fail(s|ed|ure)?|cannot|unable)\b"),
+            ('preemption', r"TERM_PREEMPT|TERM_REQUEUE|TERM_OWNER|job (was |has been )?(preempted|requeued|suspended)"),
+            ('convergence', r"no convergence|convergence (problem|failure|failed)|time ?step (is )?too small|"
+                r"timestep collapse|singular matrix"),
+            ('netlist', r"syntax error|(unknown|undefined|missing) (parameter|model|subcircuit|node|keyword|instance)|"
+                r"pars(e|ing) error|not found in netlist|cannot open (include|file)"),
+            ]
+
+    @property
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,parent=None,**kwargs):
+        try:  
+            self.parent = parent
+            self._maxattempts=kwargs.get('maxattempts',11)
+            self._basedelay=kwargs.get('basedelay',5)
+            self._backoff=kwargs.get('backoff',2)
+            self._maxdelay=kwargs.get('maxdelay',300)
+            self._jitter=kwargs.get('jitter',1.0)
+            self._budget=kwargs.get('budget',None)
+            self._retry=kwargs.get('retry',['license','preemption'])
+        except:
+            self.print_log(type='F', msg="Eldo retry policy definition failed.")
+
+    @property
+    def maxattempts(self):
+        if hasattr(self,'_maxattempts'):
+            return self._maxattempts
+        else:
+            self._maxattempts=11
+        return self._maxattempts
+    @maxattempts.setter
+    def maxattempts(self,value):
+        self._maxattempts=value
+
+    @property
+    def basedelay(self):
+        if hasattr(self,'_basedelay'):
+            return self._basedelay
+        else:
+            self._basedelay=5
+        return self._basedelay
+    @basedelay.setter
+    def basedelay(self,value):
+        self._basedelay=value
+
+    @property
+    def backoff(self):
+        if hasattr(self,'_backoff'):
+            return self._backoff
+        else:
+            self._backoff=2
+        return self._backoff
+    @backoff.setter
+    def backoff(self,value):
+        self._backoff=value
+
+    @property
+    def maxdelay(self):
+        if hasattr(self,'_maxdelay'):
+            return self._maxdelay
+        else:
+            self._maxdelay=300
+        return self._maxdelay
+    @maxdelay.setter
+    def maxdelay(self,value):
+        self._maxdelay=value
+
+    @property
+    def jitter(self):
+        if hasattr(self,'_jitter'):
+            return self._jitter
+        else:
+            self._jitter=1.0
+        return self._jitter
+    @jitter.setter
+    def jitter(self,value):
+        self._jitter=value
+
+    @property
+    def budget(self):
+        if hasattr(self,'_budget'):
+            return self._budget
+        else:
+            self._budget=None
+        return self._budget
+    @budget.setter
+    def budget(self,value):
+        self._budget=value
+
+    @property
+    def retry(self):
+        if hasattr(self,'_retry'):
+            return self._retry
+        else:
+            self._retry=['license','preemption']
+        return self._retry
+    @retry.setter
+    def retry(self,value):
+        self._retry=value
+
+    def classify(self,returncode,output='',chilog=''):
+        """Classifies a simulation outcome.
+
+        Returns
+        -------
+        str
+            'ok', 'timeout', 'memory', 'license', 'preemption', 'convergence', 
+            'netlist' or 'unknown'.
+
+        Example
+        -------
+        A netlist error after the usual license checkout messages is
+        classified as 'netlist', and is not retried:
+
+            output = ('FlexNet Licensing: checkout of feature eldokernel ok\n'
+                    'License eldokernel checked out from lmgrd@licserv\n'
+                    'ERROR 104: Unknown subcircuit INV_X1 in instance XU1\n')
+            self.eldo_retrypolicy.classify(1,output)
+        """
+        if returncode == 0:
+            return 'ok'
+        text = output + '\n' + chilog
+        for failureclass, pattern in self.patterns:
+            if re.search(pattern,text,re.I):
+                return failureclass
+        # Status code 9 seems to result from failed licensing in LSF runs
+        if returncode == 9:
+            return 'license'
+        return 'unknown'
+
+    def delay(self,attempt):
+        """Delay in seconds before the given retry (1, 2, ...)."""
+        delay = min(self.maxdelay,self.basedelay*self.backoff**(attempt-1))
+        return delay*(1-self.jitter*random.random())
+
+    def should_retry(self,failureclass,attempts,elapsed,delay=0):
+        """True if a run that failed with failureclass after the given number
+        of attempts and elapsed seconds is to be retried after delay."""
+        if failureclass not in self.retry or attempts >= self.maxattempts:
+            return False
+        if self.budget is not None and elapsed+delay > self.budget:
+            return False
+        return True
+
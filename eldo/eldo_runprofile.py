@@ -0,0 +1,195 @@
+"""
+================
+Eldo Run Profile
+================
+
+Per-phase timing of Eldo simulation runs.
+
+"""
+
+import os
+import sys
+import time
+import json
+import socket
+import threading
+from contextlib import contextmanager
+from abc import *
+from thesdk import *
+
+class eldo_runprofile(thesdk):
+    """
+    Wall-clock time, CPU time and I/O of the phases of an eldo simulation
+    run (testbench generation, export, simulation, output parsing, cleanup).
+    A new profile is started by each prepare_eldo_sim, and is accessible as
+    self.run_profile of the parent after the run.
+
+    For each phase, the following are recorded:
+
+        wall : float
+            Wall-clock time in seconds.
+        cpu : float
+            CPU time of the thread running the phase in seconds. None if a
+            phase of another run used the same thread at the same time
+            (run_eldo_async).
+        childcpu : float
+            CPU time of the finished child processes in seconds, i.e. the
+            local simulator or the submission command.
+        read, written : int
+            Bytes read and written by this process. Available on Linux only,
+            otherwise None.
+
+    The child CPU time and the I/O are counted for the whole process, so
+    they are None for a phase during which a phase of another run (sweep,
+    run_eldo_async) was active.
+
+    Example
+    -------
+        self.run_eldo()
+        print(self.run_profile.phases['read_outfile']['wall'])
+
+    Parameters
+    -----------
+    parent : object
+        The parent object initializing the
+        eldo_runprofile instance. Default None
+
+    **kwargs :
+            telemetryfile : str
+                File to which the profile is appended as a JSON line by
+                write(). Default None.
+    """
+
+    # Active phases of all runs of the process, for detecting overlaps
+    _active = {}
+    _lock = threading.Lock()
+
+    @property
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,parent=None,**kwargs):
+        try:
+            self.parent = parent
+            self._telemetryfile=kwargs.get('telemetryfile',None)
+            self.phases = {}
+            self.started = time.time()
+        except:
+            self.print_log(type='F', msg="Eldo run profile definition failed.")
+
+    @property
+    def telemetryfile(self):
+        if hasattr(self,'_telemetryfile'):
+            return self._telemetryfile
+        else:
+            self._telemetryfile=None
+        return self._telemetryfile
+    @telemetryfile.setter
+    def telemetryfile(self,value):
+        self._telemetryfile=value
+
+    # Cumulative bytes read and written by this process, or None
+    def _iocounters(self):
+        try:
+            with open('/proc/self/io') as infile:
+                counters = dict([ line.split(':') for line in infile if ':' in line ])
+            return int(counters['rchar']), int(counters['wchar'])
+        except (OSError,KeyError,ValueError):
+            return None, None
+
+    def _counters(self):
+        times = os.times()
+        read, written = self._iocounters()
+        return { 'wall' : time.perf_counter(), 'cpu' : time.thread_time(),
+                'childcpu' : times.children_user+times.children_system,
+                'read' : read, 'written' : written }
+
+    @contextmanager
+    def phase(self,name):
+        """Context manager recording the phase of the given name. Repeated
+        phases (e.g. retried simulations) accumulate."""
+        token = { 'profile' : id(self), 'thread' : threading.get_ident(), 
+                'overlap' : False, 'threadoverlap' : False }
+        with self._lock:
+            for other in self._active.values():
+                if other['profile'] != token['profile']:
+                    other['overlap'] = token['overlap'] = True
+                    if other['thread'] == token['thread']:
+                        other['threadoverlap'] = token['threadoverlap'] = True
+            self._active[id(token)] = token
+        start = self._counters()
+        try:
+            yield
+        finally:
+            stop = self._counters()
+            with self._lock:
+                del self._active[id(token)]
+            unknown = []
+            if token['overlap']:
+                unknown += ['childcpu','read','written']
+            if token['threadoverlap'] or token['thread'] != threading.get_ident():
+                unknown += ['cpu']
+            phase = self.phases.setdefault(name,{ 'wall' : 0.0, 'cpu' : 0.0, 'childcpu' : 0.0,
+                'read' : 0, 'written' : 0 })
+            for key in start:
+                if start[key] is None or phase[key] is None or key in unknown:
+                    phase[key] = None
+                else:
+                    phase[key] += stop[key]-start[key]
+
+    def add(self,name,**kwargs):
+        """Adds the given values (e.g. wall=12.3) to a phase measured elsewhere."""
+        phase = self.phases.setdefault(name,{ 'wall' : 0.0, 'cpu' : 0.0, 'childcpu' : 0.0,
+            'read' : 0, 'written' : 0 })
+        for key, value in kwargs.items():
+            phase[key] = phase.get(key,0)+value
+
+    @property
+    def total(self):
+        """Sums over all phases."""
+        total = {}
+        for phase in self.phases.values():
+            for key, value in phase.items():
+                if value is None or total.get(key,0) is None:
+                    total[key] = None
+                else:
+                    total[key] = total.get(key,0)+value
+        return total
+
+    def asdict(self):
+        """Profile as a JSON serializable dict."""
+        exitinfo = getattr(self.parent,'eldo_exitinfo',{}) if self.parent is not None else {}
+        return {
+                'name' : getattr(self.parent,'name',None),
+                'runname' : getattr(self.parent,'_runname',None),
+                'host' : socket.gethostname(),
+                'started' : self.started,
+                'phases' : self.phases,
+                'total' : self.total,
+                'exitinfo' : dict([ (key,exitinfo.get(key)) for key in
+                    ['returncode','failureclass','attempts','cached'] ])
+                }
+
+    def report(self):
+        """Logs the phases in the order they were first completed, and the total."""
+        # Values not known for overlapping runs are shown as '-'
+        seconds = lambda value: '%9.3f s' % value if value is not None else '%9s  ' % '-'
+        for name, phase in list(self.phases.items())+[('total',self.total)]:
+            self.print_log(type='I',msg='%-18s wall %s  cpu %s  child cpu %s%s' \
+                    % (name,seconds(phase['wall']),seconds(phase['cpu']),seconds(phase['childcpu']),
+                        '  read %d B  written %d B' % (phase['read'],phase['written']) \
+                                if phase['read'] is not None else ''))
+
+    def write(self,fname=None):
+        """Appends the profile as a JSON line to fname (default telemetryfile).
+        Each profile is written with a single write to a file opened in append
+        mode, so that concurrent runs can share the file."""
+        fname = fname if fname is not None else self.telemetryfile
+        if fname is None:
+            return
+        try:
+            line = json.dumps(self.asdict(),default=str) + '\n'
+            with open(fname,'a') as outfile:
+                outfile.write(line)
+        except OSError:
+            self.print_log(type='W',msg='Could not write run profile to %s.' % fname)
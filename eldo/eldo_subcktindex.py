@@ -0,0 +1,321 @@
+"""
+====================
+Eldo Subckt Index
+====================
+
+Persistent index of the subcircuit definitions of a DUT netlist.
+
+"""
+
+import os
+import sys
+import re
+import json
+import hashlib
+import tempfile
+import threading
+from abc import *
+from thesdk import *
+
+class eldo_subcktindex(thesdk):
+    """
+    Index of the .SUBCKT/.ENDS blocks of a netlist. The netlist is scanned
+    once in large chunks, and the byte offsets, header lines and ports of
+    the blocks are stored as JSON in the index directory (by default the
+    temporary directory, not the source directory of the netlist), named
+    by the hash of the netlist path. The index is rebuilt when the path, size or modification time of the
+    netlist changes, and is kept in memory for the later testbenches of the
+    process. The blocks are then read with seek, without reading the whole
+    netlist.
+
+    The blocks are those following a '*** Design cell name:' comment, as
+    parsed by eldo_module.subckt. The block of the design cell is marked
+    as 'top'.
+
+    Example
+    -------
+        index = eldo_subcktindex(self).index(self._dutfile)
+        ports = [ s['ports'] for s in index['subckts'] if s['top'] ]
+
+    Parameters
+    -----------
+    parent : object
+        The parent object initializing the
+        eldo_subcktindex instance. Default None
+
+    **kwargs :
+            chunksize : int
+                Bytes read at a time. Default 64 MB.
+            indexdir : str
+                Directory of the persistent index, e.g. a cache directory or
+                the directory of the netlist. Default None (the temporary
+                directory, also used if indexdir is not writable).
+            indexfile : str
+                File of the persistent index, overrides indexdir. Default None.
+    """
+
+    # Format of the persistent index. Incremented when the content changes.
+    version = 2
+
+    # Indexes by netlist path, shared by all instances of the process
+    _indexes = {}
+    # Concurrent runs (threads) index a netlist once
+    _lock = threading.Lock()
+
+    @property
+    def _classfile(self):
+        return os.path.dirname(os.path.realpath(__file__)) + "/"+__name__
+
+    def __init__(self,parent=None,**kwargs):
+        try:
+            self.parent = parent
+            self._chunksize=kwargs.get('chunksize',1<<26)
+            self._indexdir=kwargs.get('indexdir',None)
+            self._indexfile=kwargs.get('indexfile',None)
+        except:
+            self.print_log(type='F', msg="Eldo subcircuit index definition failed.")
+
+    @property
+    def chunksize(self):
+        if hasattr(self,'_chunksize'):
+            return self._chunksize
+        else:
+            self._chunksize=1<<26
+        return self._chunksize
+    @chunksize.setter
+    def chunksize(self,value):
+        self._chunksize=value
+
+    @property
+    def indexdir(self):
+        if hasattr(self,'_indexdir'):
+            return self._indexdir
+        else:
+            self._indexdir=None
+        return self._indexdir
+    @indexdir.setter
+    def indexdir(self,value):
+        self._indexdir=value
+
+    @property
+    def indexfile(self):
+        if hasattr(self,'_indexfile'):
+            return self._indexfile
+        else:
+            self._indexfile=None
+        return self._indexfile
+    @indexfile.setter
+    def indexfile(self,value):
+        self._indexfile=value
+
+    # Candidate files of the persistent index of a netlist
+    def _indexfiles(self,fname):
+        if self.indexfile is not None:
+            return [ self.indexfile ]
+        dirs = [ tempfile.gettempdir() ]
+        if self.indexdir is not None:
+            dirs.insert(0,self.indexdir)
+        return [ os.path.join(d,'eldo_subcktindex_%s.json' % hashlib.sha1(fname.encode()).hexdigest())
+            for d in dirs ]
+
+    def index(self,fname):
+        """Index of the subcircuits of a netlist, or None if the file does
+        not exist.
+
+        Returns
+        -------
+        dict
+            'file', 'size', 'mtime', 'cellname' (the design cell) and
+            'subckts', a list of dicts of 'name', 'top', 'start' and 'end'
+            (byte offsets of the block, end excluded), 'header' (the .SUBCKT
+            line and its continuation lines), 'ports' and 'instances' (lower
+            case names of the subcircuits instantiated in the block).
+        """
+        fname = os.path.realpath(fname)
+        try:
+            stat = os.stat(fname)
+        except OSError:
+            return None
+        key = { 'version' : self.version, 'file' : fname, 'size' : stat.st_size, 'mtime' : stat.st_mtime_ns }
+        cached = self._indexes.get(fname)
+        if cached is not None and all([ cached[k] == v for k, v in key.items() ]):
+            return cached
+        with self._lock:
+            return self._build(fname,key)
+
+    # Reads the persistent index, or scans the netlist and writes it
+    def _build(self,fname,key):
+        cached = self._indexes.get(fname)
+        if cached is not None and all([ cached[k] == v for k, v in key.items() ]):
+            return cached
+        for indexfile in self._indexfiles(fname):
+            try:
+                with open(indexfile) as infile:
+                    cached = json.load(infile)
+                if all([ cached.get(k) == v for k, v in key.items() ]):
+                    self.print_log(type='I',msg='Reading subcircuit index of %s from %s.' % (fname,indexfile))
+                    self._indexes[fname] = cached
+                    return cached
+            except (OSError,ValueError):
+                pass
+        self.print_log(type='I',msg='Indexing subcircuits of %s.' % fname)
+        index = dict(key)
+        index.update(self._scan(fname))
+        self._indexes[fname] = index
+        for indexfile in self._indexfiles(fname):
+            # A temporary file of its own for each writer, concurrent
+            # processes or threads may index the same netlist
+            tmpfile = None
+            try:
+                with tempfile.NamedTemporaryFile('w',dir=os.path.dirname(indexfile),
+                        prefix=os.path.basename(indexfile)+'.',suffix='.tmp',delete=False) as outfile:
+                    tmpfile = outfile.name
+                    json.dump(index,outfile)
+                os.replace(tmpfile,indexfile)
+                break
+            except OSError:
+                if tmpfile is not None and os.path.exists(tmpfile):
+                    os.remove(tmpfile)
+        else:
+            self.print_log(type='W',msg='Could not write subcircuit index of %s.' % fname)
+        return index
+
+    # Scans the netlist for the lines of the block boundaries, the design
+    # cell name and the subcircuit instances (with their continuation
+    # lines). Only these lines are decoded.
+    def _scan(self,fname):
+        linematch = re.compile(rb"^[ \t]*[xX][^\n]*(?:\n[ \t]*\+[^\n]*)*|\.SUBCKT|\.ENDS|\*\*\* Design cell name:",re.M)
+        state = { 'cellname' : '', 'block' : None, 'subckts' : [] }
+        offset = 0
+        rest = b''
+        with open(fname,'rb') as infile:
+            while True:
+                chunk = infile.read(self.chunksize)
+                text = rest+chunk
+                cut = text.rfind(b'\n')+1 if chunk else len(text)
+                linestart = -1
+                for match in linematch.finditer(text,0,cut):
+                    start = text.rfind(b'\n',0,match.start())+1
+                    if start == linestart:
+                        # Several matches on one line
+                        continue
+                    linestart = start
+                    end = text.find(b'\n',match.end()-1 if match.end() > match.start() else match.start(),len(text))
+                    if chunk and (end < 0 or text.find(b'\n',end+1) < 0):
+                        # The statement may continue in the next chunk
+                        cut = start
+                        break
+                    end = len(text) if end < 0 else end+1
+                    self._line(text[start:end].decode(errors='replace'),offset+start,offset+end,state)
+                offset += cut
+                rest = text[cut:]
+                if not chunk:
+                    break
+            if state['block'] is not None:
+                # Block without .ENDS extends to the end of the file
+                state['block']['end'] = offset
+                state['subckts'].append(state['block'])
+            for block in state['subckts']:
+                block['header'] = self._header(infile,block)
+                block['ports'] = self._ports(block['header'])
+                block['instances'] = sorted(block['instances'])
+        return { 'cellname' : state['cellname'], 'subckts' : state['subckts'] }
+
+    def _line(self,line,start,end,state):
+        words = line.split()
+        if state['block'] is not None and words[0][0] in 'xX':
+            state['block']['instances'].add(self._instanceof(words))
+            return
+        if state['block'] is None:
+            if '*** Design cell name:' in line and len(words) > 0:
+                state['cellname'] = words[-1]
+            if '.SUBCKT' in line and state['cellname'] != '':
+                name = words[1] if len(words) > 1 else ''
+                state['block'] = { 'name' : name, 'top' : name.lower() == state['cellname'].lower(),
+                        'start' : start, 'instances' : set() }
+        if state['block'] is not None and '.ENDS' in line:
+            state['block']['end'] = end
+            state['subckts'].append(state['block'])
+            state['block'] = None
+
+    # Subcircuit name (lower case) of an instance statement, the last
+    # word before the parameters
+    def _instanceof(self,words):
+        names = []
+        for word in words[1:]:
+            if word.lower() in ['param:','params:']:
+                break
+            if '=' not in word and word != '+':
+                names.append(word.lstrip('+').strip('()'))
+        return names[-1].lower() if len(names) > 0 else ''
+
+    # The .SUBCKT line followed by the lines starting with '+' (or empty)
+    def _header(self,infile,block):
+        infile.seek(block['start'])
+        header = [ infile.readline().decode(errors='replace').rstrip('\n') ]
+        while infile.tell() < block['end']:
+            line = infile.readline().decode(errors='replace').rstrip('\n')
+            if len(line) > 0 and line[0] != '+':
+                break
+            header.append(line)
+        return header
+
+    def _ports(self,header):
+        words = header[0].split()[2:]
+        for line in header[1:]:
+            words += line.lstrip('+').split()
+        return [ w for w in words if '=' not in w and w.lower() not in ['param:','params:'] ]
+
+    def reachable(self,index):
+        """Blocks of the index instantiated by the design cell, directly or
+        through other blocks, and the design cell itself. All blocks if the
+        design cell is not found."""
+        blocks = {}
+        for block in index['subckts']:
+            blocks.setdefault(block['name'].lower(),[]).append(block)
+        tops = [ block['name'].lower() for block in index['subckts'] if block['top'] ]
+        if len(tops) == 0:
+            return index['subckts']
+        reached = set(tops)
+        pending = list(tops)
+        while pending:
+            for block in blocks.get(pending.pop(),[]):
+                for name in block['instances']:
+                    if name not in reached:
+                        reached.add(name)
+                        pending.append(name)
+        return [ block for block in index['subckts'] if block['name'].lower() in reached ]
+
+    def copy(self,fname,outfile,blocks,renames={}):
+        """Copies the given blocks of a netlist to an open binary file.
+        Adjacent blocks are copied with a single read. The blocks whose
+        name is a key of renames are renamed in their .SUBCKT line."""
+        with open(fname,'rb') as infile:
+            start = end = None
+            for block in blocks+[None]:
+                if block is not None and block['name'] not in renames and block['start'] == end:
+                    end = block['end']
+                    continue
+                if start is not None:
+                    self._copyrange(infile,outfile,start,end)
+                    start = end = None
+                if block is None:
+                    continue
+                if block['name'] in renames:
+                    infile.seek(block['start'])
+                    words = infile.readline().decode(errors='replace').split()
+                    words[1] = renames[block['name']]
+                    outfile.write((' '.join(words) + '\n').encode())
+                    self._copyrange(infile,outfile,infile.tell(),block['end'])
+                else:
+                    start, end = block['start'], block['end']
+
+    def _copyrange(self,infile,outfile,start,end,bufsize=1<<24):
+        infile.seek(start)
+        remaining = end-start
+        while remaining > 0:
+            data = infile.read(min(bufsize,remaining))
+            if not data:
+                break
+            outfile.write(data)
+            remaining -= len(data)
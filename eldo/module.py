@@ -1,9 +1,11 @@
 # Written by Marko Kosunen 20190109
 # marko.kosunen@aalto.fi
 import os
+import io
 import pdb
 from thesdk import *
 from eldo import *
+from eldo.eldo_subcktindex import eldo_subcktindex
 from copy import deepcopy
 
 class eldo_module(thesdk):
@@ -47,75 +49,178 @@ class eldo_module(thesdk):
     def contents(self,value):
         self._contents=None
 
+    # Index of the subcircuit definitions of the DUT file, None if the
+    # file does not exist
+    @property
+    def dutindex(self):
+        if not hasattr(self,'_dutindex'):
+            self._dutindex=eldo_subcktindex(self,
+                    indexdir=getattr(self.parent,'eldo_indexdir',None)).index(self._dutfile)
+        return self._dutindex
+    @dutindex.setter
+    def dutindex(self,value):
+        self._dutindex=value
+
+    # Writing the subcircuit definitions of the DUT to an open binary file.
+    # The blocks are copied from the DUT file through the index, and the
+    # design cell is renamed to the name of the parent. With prune_subckts,
+    # only the blocks instantiated by the design cell are written. With
+    # eldo_dutinclude, the DUT file is included instead of copied.
+    def write_subckt(self,outfile):
+        outfile.write(b"*** Subcircuit definitions\n\n")
+        index = self.dutindex
+        if index is None:
+            self.print_log(type='W',msg='File %s not found.' % self._dutfile)
+            return
+        mode = getattr(self.parent,'eldo_dutinclude','copy')
+        if mode != 'copy':
+            outfile.write(self._wrapper(index,mode).encode())
+            return
+        subckts = index['subckts']
+        if getattr(self.parent,'prune_subckts',False):
+            subckts = eldo_subcktindex(self).reachable(index)
+            kept = set([ id(block) for block in subckts ])
+            pruned = [ block for block in index['subckts'] if id(block) not in kept ]
+            self.print_log(type='I',msg='Pruned %d of %d subcircuits not instantiated by %s (%d bytes).' \
+                    % (len(pruned),len(index['subckts']),index['cellname'],
+                        sum([ block['end']-block['start'] for block in pruned ])))
+        blocks = []
+        for block in subckts+[None]:
+            if block is not None and not block['top']:
+                blocks.append(block)
+                continue
+            eldo_subcktindex(self).copy(index['file'],outfile,blocks)
+            blocks = []
+            if block is not None:
+                outfile.write(("\n*** Subcircuit definition for %s module\n" % self.parent.name).encode())
+                eldo_subcktindex(self).copy(index['file'],outfile,[block],
+                        renames={ block['name'] : self.parent.name.upper() })
+
+    # Including the DUT file (or a link to it) as is. The design cell is
+    # wrapped to a subcircuit of the name of the parent, passing the ports
+    # and the parameters.
+    def _wrapper(self,index,mode):
+        if mode == 'include':
+            dutfile = index['file']
+        elif mode in ['hardlink','symlink']:
+            dutfile = self._linkdut(index['file'],mode)
+        else:
+            self.print_log(type='F',msg='DUT inclusion mode \'%s\' undefined.' % mode)
+        if getattr(self.parent,'prune_subckts',False):
+            self.print_log(type='W',msg='Subcircuits are not pruned when the DUT file is included.')
+        wrapper = "*** DUT netlist\n.include %s\n" % dutfile
+        tops = [ block for block in index['subckts'] if block['top'] ]
+        if len(tops) == 0:
+            self.print_log(type='W',msg='Design cell %s not found in %s.' % (index['cellname'],index['file']))
+        elif tops[0]['name'].lower() != self.parent.name.lower():
+            header = tops[0]['header']
+            words = header[0].split()
+            words[1] = self.parent.name.upper()
+            params = [ word.split('=')[0] for line in header for word in line.split() if '=' in word ]
+            wrapper += "\n*** Subcircuit definition for %s module\n" % self.parent.name
+            wrapper += ' '.join(words) + "\n"
+            for line in header[1:]:
+                wrapper += line + "\n"
+            wrapper += "X%s %s %s%s\n" % (tops[0]['name'].lower(),' '.join(tops[0]['ports']),tops[0]['name'],
+                    ''.join([ ' %s=%s' % (param,param) for param in params ]))
+            wrapper += ".ENDS\n"
+        return wrapper
+
+    # Link to the DUT file next to the exported subcircuit file. A hard link
+    # falls back to a symbolic link (e.g. across file systems), and that to
+    # the DUT file itself. The link is stored in the eldo_dutlink of the
+    # parent, and removed with the other generated files.
+    def _linkdut(self,dutfile,mode):
+        linkname = os.path.join(os.path.dirname(self.parent.eldosubcktsrc),'dut_' + os.path.basename(dutfile))
+        if os.path.realpath(linkname) == dutfile:
+            self.parent.eldo_dutlink = linkname
+            return linkname
+        try:
+            if os.path.lexists(linkname):
+                os.remove(linkname)
+            if mode == 'hardlink':
+                try:
+                    os.link(dutfile,linkname)
+                    self.parent.eldo_dutlink = linkname
+                    return linkname
+                except OSError:
+                    self.print_log(type='W',msg='Could not hard link %s, using a symbolic link.' % dutfile)
+            os.symlink(dutfile,linkname)
+            self.parent.eldo_dutlink = linkname
+            return linkname
+        except OSError:
+            self.print_log(type='W',msg='Could not link %s, including it directly.' % dutfile)
+            return dutfile
+
     # Parsing the subcircuit definition from input netlist
     @property
     def subckt(self):
         if not hasattr(self,'_subckt'):
-            cellnamematch=re.compile(r"\*\*\* Design cell name:")
-            startmatch=re.compile(r"\.SUBCKT")
-            endmatch=re.compile(r"\.ENDS")
-            cellname = ""
-            self._subckt="*** Subcircuit definitions\n\n"
-            # Extract the module definition
-            if os.path.isfile(self._dutfile):
-                with open(self._dutfile) as infile:
-                    wholefile=infile.readlines()
-                    startfound=False
-                    endfound=False
-                    for line in wholefile:
-                        if not startfound and cellnamematch.search(line) != None:
-                            words = line.split()
-                            cellname = words[-1]
-                        if not startfound and startmatch.search(line) != None and cellname != "":
-                            startfound=True
-                            words = line.split()
-                            if words[1].lower() == cellname.lower():
-                                self._subckt+="\n*** Subcircuit definition for %s module\n" % self.parent.name
-                                words[1] = self.parent.name.upper()
-                                line = ' '.join(words) + "\n"
-                        if startfound:
-                            self._subckt=self._subckt+line
-                        if startfound and endmatch.search(line) != None:
-                            startfound=False
-            else:
-                self.print_log(type='W',msg='File %s not found.' % self._dutfile)
+            buf = io.BytesIO()
+            self.write_subckt(buf)
+            self._subckt=buf.getvalue().decode(errors='replace')
+            self._subcktset=False
         return self._subckt
     @subckt.setter
     def subckt(self,value):
         self._subckt=value
+        # A definition set explicitly overrides the DUT file also in subinst
+        self._subcktset=value is not None
     @subckt.deleter
     def subckt(self,value):
         self._subckt=None
 
-    # Generating subcircuit instance from the definition
+    # Generating subcircuit instance from the header of the design cell,
+    # or from the definition if subckt was set explicitly
     @property
     def subinst(self):
         if not hasattr(self,'_subinst'):
-            startmatch=re.compile(r"\.SUBCKT %s" % self.parent.name.upper())
-            subckt = self.subckt.split('\n')
-            if len(subckt) <= 3:
+            if getattr(self,'_subcktset',False):
+                self._subinst = self._subinst_from_subckt()
+                return self._subinst
+            index = self.dutindex
+            if index is None or len(index['subckts']) == 0:
                 self.print_log(type='W',msg='No subcircuit found.')
                 self._subinst = "*** Empty subcircuit\n"
             else:
                 self._subinst = "*** Subcircuit instance\n"
-                startfound = False
-                endfound = False
-                # Extract the module definition
-                for line in subckt:
-                    if startmatch.search(line) != None:
-                        startfound = True
-                    elif startfound and len(line) > 0 and line[0] != "+":
-                        endfound = True
-                        startfound = False
-                    if startfound and not endfound:
-                        words = line.split(" ")
-                        if words[0].lower() == ".subckt":
-                            words[0] = "X%s" % self.parent.name.lower()
-                            words.pop(1)
-                            line = ' '.join(words)
-                        self._subinst += line + "\n"
+                for block in index['subckts']:
+                    if block['top']:
+                        words = block['header'][0].split()
+                        words[0] = "X%s" % self.parent.name.lower()
+                        words.pop(1)
+                        self._subinst += ' '.join(words) + "\n"
+                        for line in block['header'][1:]:
+                            self._subinst += line + "\n"
+                        break
                 self._subinst += "+" + self.parent.name.upper()
         return self._subinst
+
+    def _subinst_from_subckt(self):
+        startmatch=re.compile(r"\.SUBCKT %s" % self.parent.name.upper())
+        subckt = self.subckt.split('\n')
+        if len(subckt) <= 3:
+            self.print_log(type='W',msg='No subcircuit found.')
+            return "*** Empty subcircuit\n"
+        subinst = "*** Subcircuit instance\n"
+        startfound = False
+        endfound = False
+        # Extract the module definition
+        for line in subckt:
+            if startmatch.search(line) != None:
+                startfound = True
+            elif startfound and len(line) > 0 and line[0] != "+":
+                endfound = True
+                startfound = False
+            if startfound and not endfound:
+                words = line.split(" ")
+                if words[0].lower() == ".subckt":
+                    words[0] = "X%s" % self.parent.name.lower()
+                    words.pop(1)
+                    line = ' '.join(words)
+                subinst += line + "\n"
+        return subinst + "+" + self.parent.name.upper()
+
     @subinst.setter
     def subinst(self,value):
         self._subinst=value
@@ -123,16 +228,56 @@ class eldo_module(thesdk):
     def subinst(self,value):
         self._subinst=None
 
+    # Settings (eldoparameters, eldocorner or eldooptions) of the k:th run.
+    # Without batched runs, these are the properties of the parent.
+    def runsetting(self,attr,k=0):
+        setting = dict(getattr(self.parent,attr))
+        runs = getattr(self.parent,'eldoruns',[])
+        if len(runs) > k:
+            setting.update(runs[k].get(attr,{}))
+        return setting
+
+    def _optionstr(self,options):
+        optstr = ""
+        for optname,optval in options.items():
+            if optval != "":
+                optstr += ".option " + optname + "=" + optval + "\n"
+            else:
+                optstr += ".option " + optname + "\n"
+        return optstr
+
+    def _parameterstr(self,parameters):
+        parstr = ""
+        for parname,parval in parameters.items():
+            parstr += ".param " + parname + "=" + str(parval) + "\n"
+        return parstr
+
+    def _libstr(self,corners):
+        libfile = ""
+        corner = "top_tt"
+        temp = "27"
+        for optname,optval in corners.items():
+            if optname == "temp":
+                temp = optval
+            if optname == "corner":
+                corner = optval
+        try:
+            libfile = thesdk.GLOBALS['ELDOLIBFILE']
+            libstr = "*** Eldo device models\n"
+            libstr += ".lib " + libfile + " " + corner + "\n"
+        except:
+            self.print_log(type='W',msg='Global TheSDK variable ELDOLIBPATH not set.')
+            libstr = "*** Eldo device models (undefined)\n"
+            libstr += "*.lib " + libfile + " " + corner + "\n"
+        libstr += ".temp " + str(temp) + "\n"
+        return libstr
+
     # Generating eldo options string
     @property
     def options(self):
         if not hasattr(self,'_options'):
             self._options = "*** Options\n"
-            for optname,optval in self.parent.eldooptions.items():
-                if optval != "":
-                    self._options += ".option " + optname + "=" + optval + "\n"
-                else:
-                    self._options += ".option " + optname + "\n"
+            self._options += self._optionstr(self.runsetting('eldooptions'))
         return self._options
     @options.setter
     def options(self,value):
@@ -146,8 +291,7 @@ class eldo_module(thesdk):
     def parameters(self):
         if not hasattr(self,'_parameters'):
             self._parameters = "*** Parameters\n"
-            for parname,parval in self.parent.eldoparameters.items():
-                self._parameters += ".param " + parname + "=" + str(parval) + "\n"
+            self._parameters += self._parameterstr(self.runsetting('eldoparameters'))
         return self._parameters
     @parameters.setter
     def parameters(self,value):
@@ -160,23 +304,7 @@ class eldo_module(thesdk):
     @property
     def libcmd(self):
         if not hasattr(self,'_libcmd'):
-            libfile = ""
-            corner = "top_tt"
-            temp = "27"
-            for optname,optval in self.parent.eldocorner.items():
-                if optname == "temp":
-                    temp = optval
-                if optname == "corner":
-                    corner = optval
-            try:
-                libfile = thesdk.GLOBALS['ELDOLIBFILE']
-                self._libcmd = "*** Eldo device models\n"
-                self._libcmd += ".lib " + libfile + " " + corner + "\n"
-            except:
-                self.print_log(type='W',msg='Global TheSDK variable ELDOLIBPATH not set.')
-                self._libcmd = "*** Eldo device models (undefined)\n"
-                self._libcmd += "*.lib " + libfile + " " + corner + "\n"
-            self._libcmd += ".temp " + temp + "\n"
+            self._libcmd = self._libstr(self.runsetting('eldocorner'))
         return self._libcmd
     @libcmd.setter
     def libcmd(self,value):
@@ -13,6 +13,7 @@ import numpy as np
 import pandas as pd
 from functools import reduce
 import textwrap
+import hashlib
 from datetime import datetime
 ## Some guidelines:
 ## DUT is parsed from the eldo file.
@@ -35,13 +36,7 @@ class testbench(eldo_module):
         else:
             self.parent=parent
         try:  
-            if self.parent.interactive_eldo:
-                self._file=self.parent.eldosrcpath + '/tb_' + self.parent.name + '.cir'
-                self._subcktfile=self.parent.eldosrcpath + '/subckt_' + self.parent.name + '.cir'
-            else:
-                self._file=self.parent.eldosimpath + '/tb_' + self.parent.name + '.cir'
-                self._subcktfile=self.parent.eldosimpath + '/subckt_' + self.parent.name + '.cir'
-            self._dutfile=self.parent.eldosrcpath + '/' + self.parent.name + '.cir'
+            self._set_paths()
             self._trantime=0
         except:
             self.print_log(type='F', msg="Eldo Testbench file definition failed")
@@ -52,6 +47,84 @@ class testbench(eldo_module):
         self.dcsources=Bundle()
         self.simcmds=Bundle()
         
+    def _set_paths(self):
+        if self.parent.interactive_eldo:
+            self._file=self.parent.eldosrcpath + '/tb_' + self.parent.name + '.cir'
+            self._subcktfile=self.parent.eldosrcpath + '/subckt_' + self.parent.name + '.cir'
+        else:
+            self._file=self.parent.eldosimpath + '/tb_' + self.parent.name + '.cir'
+            self._subcktfile=self.parent.eldosimpath + '/subckt_' + self.parent.name + '.cir'
+        self._dutfile=self.parent.eldosrcpath + '/' + self.parent.name + '.cir'
+
+    # Signature of the Data of an iofile
+    def _datasignature(self,data):
+        if isinstance(data,np.ndarray) and data.dtype != object:
+            return (data.shape,str(data.dtype),hashlib.sha1(np.ascontiguousarray(data).view(np.uint8)).hexdigest())
+        return repr(data)
+
+    # Inputs of each generated section. A reused testbench regenerates
+    # a section only when its inputs have changed.
+    def _signatures(self):
+        p = self.parent
+        if os.path.isfile(self._dutfile):
+            dutstat = os.stat(self._dutfile)
+            dut = (self._dutfile,dutstat.st_size,dutstat.st_mtime_ns,p.name)
+        else:
+            dut = (self._dutfile,p.name)
+        inputs = []
+        outputs = []
+        for name, val in self.iofiles.Members.items():
+            if val.dir.lower()=='in' or val.dir.lower()=='input':
+                inputs.append((name,val.iotype,tuple(val.ionames),tuple(val.file),val.sourcetype,
+                    val.vhi,val.vlo,val.tfall,val.trise,val.rs,val.inlinelimit,
+                    self._datasignature(val.Data)))
+            elif val.dir.lower()=='out' or val.dir.lower()=='output':
+                outputs.append((name,val.iotype,tuple(val.ionames),tuple(val.file),val.sourcetype,
+                    val.edgetype,val.vth,val.trigger))
+        dcsources = [ (v.sourcetype,v.name,v.pos,v.neg,v.value,v.extract,v.ext_start,v.ext_stop) 
+                for n, v in self.dcsources.Members.items() ]
+        simcmds = [ (n,v.tprint,v.tstop,v.uic,v.noise,v.fmin,v.fmax,v.seed) 
+                for n, v in self.simcmds.Members.items() ]
+        return {
+                '_libcmd' : (repr((p.eldocorner,p.eldoruns)),thesdk.GLOBALS.get('ELDOLIBFILE')),
+                '_includecmd' : self._subcktfile,
+                '_options' : repr((p.eldooptions,p.eldoruns)),
+                '_parameters' : repr((p.eldoparameters,p.eldoruns)),
+                '_dutindex' : dut,
+                '_subckt' : (dut,p.prune_subckts,p.eldo_dutinclude,self._subcktfile),
+                '_subinst' : dut,
+                '_misccmd' : repr(p.eldomisc),
+                '_dcsourcestr' : repr(dcsources),
+                '_inputsignals' : repr(inputs),
+                # The transient time depends on the inputs
+                '_simcmdstr' : repr((simcmds,inputs)),
+                '_runcmd' : (repr((p.eldoparameters,p.eldocorner,p.eldooptions,p.eldoruns,p.eldorunmode)),
+                    thesdk.GLOBALS.get('ELDOLIBFILE')),
+                '_plotcmd' : repr((p.eldoplotextras,p.consolidate_outputs,outputs,
+                    p.eldoprintfile if p.consolidate_outputs else None,
+                    p.eldoextractfile if p.consolidate_outputs else None)),
+                }
+
+    def update(self):
+        """Prepares a reused testbench for a new simulation. Sections whose 
+        inputs (parent properties, iofiles, sources, DUT file) changed since
+        the previous generate_contents are dropped, so that they are regenerated."""
+        self._set_paths()
+        signatures = self._signatures()
+        previous = getattr(self,'_sectionsignatures',{})
+        changed = [ section for section, signature in signatures.items() 
+                if previous.get(section) != signature and section in self.__dict__ ]
+        if getattr(self,'_subcktset',False):
+            # An explicitly set subckt does not depend on the DUT file
+            changed = [ section for section in changed if section not in ['_subckt','_subinst'] ]
+        for section in changed:
+            delattr(self,section)
+        if '_inputsignals' in changed:
+            self._trantime = 0
+            self.includefiles = {}
+        self.print_log(type='I',msg='Regenerating testbench sections: %s.' \
+                % (', '.join([ c.lstrip('_') for c in changed ]) if changed else 'none'))
+
     @property
     def file(self):
         if not hasattr(self,'_file'):
@@ -116,20 +189,26 @@ class testbench(eldo_module):
                                     (val.sourcetype.upper(),val.ionames[i].lower(),val.ionames[i].upper(),val.file[i])
                     elif val.iotype.lower()=='sample':
                         for i in range(len(val.ionames)):
-                            pattstr = ''
-                            for d in val.Data[:,i]:
-                                pattstr += '%s ' % str(d)
+                            pattstr = val.sigbus_pattern(i)
                             if float(self._trantime) < len(val.Data)/val.rs:
                                 self._trantime = len(val.Data)/val.rs
                             # Checking if the given bus is actually a 1-bit signal
-                            if ('<' not in val.ionames[i]) and ('>' not in val.ionames[i]) and len(str(val.Data[0,i])) == 1:
+                            if ('<' not in val.ionames[i]) and ('>' not in val.ionames[i]) and pattstr.index(' ') == 1:
                                 busname = '%s_BUS' % val.ionames[i]
                                 self._inputsignals += '.setbus %s %s\n' % (busname,val.ionames[i])
                             else:
                                 busname = val.ionames[i]
                             # Adding the source
-                            self._inputsignals += ".sigbus %s vhi=%s vlo=%s tfall=%s trise=%s thold=%s tdelay=%s base=%s PATTERN %s\n" % \
-                                    (busname,str(val.vhi),str(val.vlo),str(val.tfall),str(val.trise),str(1/val.rs),'0','bin',pattstr)
+                            sigbus = ".sigbus %s vhi=%s vlo=%s tfall=%s trise=%s thold=%s tdelay=%s base=%s PATTERN" % \
+                                    (busname,str(val.vhi),str(val.vlo),str(val.tfall),str(val.trise),str(1/val.rs),'0','bin')
+                            if len(pattstr) > val.inlinelimit:
+                                # Long patterns go to an include file, wrapped to continuation lines
+                                words = pattstr.split()
+                                self.includefiles[val.file[i]] = sigbus + "\n" + \
+                                        "".join(["+ %s\n" % ' '.join(words[k:k+64]) for k in range(0,len(words),64)])
+                                self._inputsignals += ".include \"%s\"\n" % val.file[i]
+                            else:
+                                self._inputsignals += "%s %s\n" % (sigbus,pattstr)
                     else:
                         print_log(type='F',msg='Input type \'%s\' undefined.' % val.iotype)
 
@@ -143,6 +222,16 @@ class testbench(eldo_module):
     def inputsignals(self,value):
         self._inputsignals=None
 
+    # Netlist fragments written next to the testbench on export
+    @property
+    def includefiles(self):
+        if not hasattr(self,'_includefiles'):
+            self._includefiles = {}
+        return self._includefiles
+    @includefiles.setter
+    def includefiles(self,value):
+        self._includefiles=value
+
     # Generating eldo simcmds string
     @property
     def simcmdstr(self):
@@ -166,10 +255,61 @@ class testbench(eldo_module):
     def simcmdstr(self,value):
         self._simcmdstr=None
 
+    # Netlist construct of the batched runs: 'step' or 'alter'
+    @property
+    def runmode(self):
+        runs = self.parent.eldoruns
+        mode = self.parent.eldorunmode
+        varied = set([ (attr,name) for run in runs for attr in run for name in run[attr] ])
+        unknown = [ attr for run in runs for attr in run 
+                if attr not in ['eldoparameters','eldocorner','eldooptions'] ]
+        if len(unknown) > 0:
+            self.print_log(type='F',msg='Settings %s cannot be varied in batched runs.' % sorted(set(unknown)))
+        steppable = len(varied) == 1 and list(varied)[0][0] == 'eldoparameters' \
+                and all([ len(run.get('eldoparameters',{})) == 1 for run in runs ])
+        if mode == 'auto':
+            mode = 'step' if steppable else 'alter'
+        elif mode == 'step' and not steppable:
+            self.print_log(type='F',msg='Runs vary %s. Stepping is possible for a single parameter only, use eldorunmode=\'alter\'.' \
+                    % ', '.join([ name for attr, name in sorted(varied) ]))
+        elif mode != 'step' and mode != 'alter':
+            self.print_log(type='F',msg='Run mode \'%s\' undefined.' % mode)
+        return mode
+
+    # Generating the .step or .alter statements of the batched runs.
+    # The first run is the nominal simulation.
+    @property
+    def runcmd(self):
+        if not hasattr(self,'_runcmd'):
+            self._runcmd = ""
+            runs = self.parent.eldoruns
+            if len(runs) > 1:
+                self._runcmd = "*** Batched runs\n"
+                if self.runmode == 'step':
+                    parname = list(runs[0]['eldoparameters'].keys())[0]
+                    self._runcmd += ".step param %s list %s\n" % \
+                            (parname,' '.join([ str(run['eldoparameters'][parname]) for run in runs ]))
+                else:
+                    for k in range(1,len(runs)):
+                        self._runcmd += "\n.alter run%d\n" % k
+                        if 'eldooptions' in runs[k] or 'eldooptions' in runs[0]:
+                            self._runcmd += self._optionstr(self.runsetting('eldooptions',k))
+                        self._runcmd += self._parameterstr(self.runsetting('eldoparameters',k))
+                        if 'eldocorner' in runs[k] or 'eldocorner' in runs[0]:
+                            self._runcmd += self._libstr(self.runsetting('eldocorner',k))
+        return self._runcmd
+    @runcmd.setter
+    def runcmd(self,value):
+        self._runcmd=value
+    @runcmd.deleter
+    def runcmd(self,value):
+        self._runcmd=None
+
     # Generating eldo plot and print commands
     @property
     def plotcmd(self):
         if not hasattr(self,'_plotcmd'):
+            self._plotcmd = ""
             # TODO: This manual plot should be moved elsewhere
             if len(self.parent.eldoplotextras) > 0:
                 self._plotcmd = "*** Manually probed signals\n"
@@ -178,13 +318,20 @@ class testbench(eldo_module):
                     self._plotcmd += i + " "
                 self._plotcmd += "\n\n"
             self._plotcmd += "*** Output signals\n"
+            # In consolidated mode, all event outputs are printed to a single file
+            # and all extracts go to a single file
+            consolidate = self.parent.consolidate_outputs
+            printprobes = []
             for name, val in self.iofiles.Members.items():
                 # Output iofile becomes an extract command
                 if val.dir.lower()=='out' or val.dir.lower()=='output':
                     if val.iotype=='event':
                         for i in range(len(val.ionames)):
-                            self._plotcmd += ".printfile %s(%s) file=\"%s\"\n" % \
-                                    (val.sourcetype,val.ionames[i].upper(),val.file[i])
+                            if consolidate:
+                                printprobes.append("%s(%s)" % (val.sourcetype,val.ionames[i].upper()))
+                            else:
+                                self._plotcmd += ".printfile %s(%s) file=\"%s\"\n" % \
+                                        (val.sourcetype,val.ionames[i].upper(),val.file[i])
                     elif val.iotype=='sample':
                         for i in range(len(val.ionames)):
                             if val.edgetype.lower()=='falling':
@@ -193,7 +340,8 @@ class testbench(eldo_module):
                                 polarity = 'tcross'
                             else:
                                 polarity = 'xup'
-                            self._plotcmd += ".extract file=\"%s\" vect label=%s yval(v(%s<*>),%s(v(%s),%s))\n" % (val.file[i],val.ionames[i],val.ionames[i].upper(),polarity,val.trigger,val.vth)
+                            extractfile = self.parent.eldoextractfile if consolidate else val.file[i]
+                            self._plotcmd += ".extract file=\"%s\" vect label=%s yval(v(%s<*>),%s(v(%s),%s))\n" % (extractfile,val.ionames[i],val.ionames[i].upper(),polarity,val.trigger,val.vth)
                     elif val.iotype=='time':
                         for i in range(len(val.ionames)):
                             vthstr = ',%s' % str(val.vth)
@@ -210,9 +358,13 @@ class testbench(eldo_module):
                                 vthstr = ''
                             else:
                                 edge = 'xup'
-                            self._plotcmd += ".extract file=\"%s\" vect label=%s %s(v(%s)%s)\n" % (val.file[i],val.ionames[i],edge,val.ionames[i].upper(),vthstr)
+                            extractfile = self.parent.eldoextractfile if consolidate else val.file[i]
+                            self._plotcmd += ".extract file=\"%s\" vect label=%s %s(v(%s)%s)\n" % (extractfile,val.ionames[i],edge,val.ionames[i].upper(),vthstr)
                     else:
                         self.print_log(type='W',msg='Output filetype incorrectly defined.')
+            if len(printprobes) > 0:
+                self._plotcmd += ".printfile %s file=\"%s\"\n" % \
+                        (' '.join(printprobes),self.parent.eldoprintfile)
         return self._plotcmd
     @plotcmd.setter
     def plotcmd(self,value):
@@ -223,6 +375,10 @@ class testbench(eldo_module):
 
 
     def export(self,**kwargs):
+        for fname, contents in self.includefiles.items():
+            self.print_log(type='I',msg='Exporting eldo include file %s.' % fname)
+            with open(fname, "w") as incfile:
+                incfile.write(contents)
         if not os.path.isfile(self.file):
             self.print_log(type='I',msg='Exporting eldo testbench to %s.' %(self.file))
             with open(self.file, "w") as module_file:
@@ -239,16 +395,24 @@ class testbench(eldo_module):
     def export_subckt(self,**kwargs):
         if not os.path.isfile(self.parent.eldosubcktsrc):
             self.print_log(type='I',msg='Exporting eldo subcircuit to %s.' %(self.parent.eldosubcktsrc))
-            with open(self.parent.eldosubcktsrc, "w") as module_file:
-                module_file.write(self.subckt)
+            self._write_subcktfile()
 
         elif os.path.isfile(self.parent.eldosubcktsrc) and not kwargs.get('force'):
             self.print_log(type='F', msg=('Export target file %s exists.\n Force overwrite with force=True.' %(self.parent.eldosubcktsrc)))
 
         elif kwargs.get('force'):
             self.print_log(type='I',msg='Forcing overwrite of eldo subcircuit to %s.' %(self.parent.eldosubcktsrc))
+            self._write_subcktfile()
+
+    # A subckt given or already generated is written as is, otherwise
+    # the definitions are copied from the DUT file through the index
+    def _write_subcktfile(self):
+        if getattr(self,'_subckt',None) is not None:
             with open(self.parent.eldosubcktsrc, "w") as module_file:
                 module_file.write(self.subckt)
+        else:
+            with open(self.parent.eldosubcktsrc, "wb") as module_file:
+                self.write_subckt(module_file)
 
     def generate_contents(self):
         date_object = datetime.now()
@@ -266,6 +430,7 @@ class testbench(eldo_module):
         misccmd = self.misccmd
         simcmd = self.simcmdstr
         plotcmd = self.plotcmd
+        runcmd = self.runcmd
         self.contents = headertxt + "\n" +\
                         libcmd + "\n" +\
                         includecmd + "\n" +\
@@ -277,7 +442,9 @@ class testbench(eldo_module):
                         inputsignals + "\n" +\
                         simcmd + "\n" +\
                         plotcmd + "\n" +\
+                        runcmd + "\n" +\
                         ".end"
+        self._sectionsignatures = self._signatures()
 
 if __name__=="__main__":
     pass